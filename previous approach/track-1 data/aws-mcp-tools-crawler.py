@@ -3,28 +3,14 @@ import ast
 import json
 import os
 import re
+import sys
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
-
-# --- Constants ---
-# Token estimation formula: 50 (base) + (word_count / 0.75) + (param_count * 40)
-TOKEN_BASE_COST = 50
-TOKEN_PER_PARAM_COST = 40
-TOKEN_WORD_DIVISOR = 0.75
+sys.path.append("../../src/aid_framework")
+from token_accounting import TokenCounter, TOKENIZER_ID
 
 # --- Helper Functions ---
 
-def estimate_tokens(description: str, param_count: int) -> int:
-    """Estimates the token count for a tool's schema."""
-    if not description:
-        description = ""
-    word_count = len(description.strip().split())
-    
-    description_cost = word_count / TOKEN_WORD_DIVISOR
-    param_cost = param_count * TOKEN_PER_PARAM_COST
-    
-    return int(TOKEN_BASE_COST + description_cost + param_cost)
-
 def get_complexity(tool_count: int) -> str:
     """Categorizes server complexity based on the number of tools."""
     if tool_count <= 5:
@@ -135,8 +121,7 @@ def parse_python_file(file_path: Path) -> Optional[List[Dict[str, Any]]]:
                         "name": name,
                         "description": description,
                         "parameters": parameters,
-                        "parameter_count": param_count,
-                        "estimated_tokens": estimate_tokens(description, param_count)
+                        "parameter_count": param_count
                     }
                     tools.append(tool_data)
                     # A function can only be one tool, so break after finding the decorator
@@ -249,8 +234,7 @@ def parse_typescript_file(file_path: Path) -> Optional[List[Dict[str, Any]]]:
                 "name": name,
                 "description": description,
                 "parameters": parameters,
-                "parameter_count": param_count,
-                "estimated_tokens": estimate_tokens(description, param_count)
+                "parameter_count": param_count
             }
             tools.append(tool_data)
     
@@ -275,6 +259,12 @@ def main():
         required=True,
         help="Path to the output JSON dataset file."
     )
+    parser.add_argument(
+        "--tokenizer",
+        type=str,
+        default=TOKENIZER_ID,
+        help="Tokenizer used to count schema tokens."
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -295,6 +285,7 @@ def main():
         print(f"Error: No .py, .ts, or .js files found in '{input_path}'")
         return
 
+    counter = TokenCounter(model_id=args.tokenizer)
     all_servers_data = []
     errors = []
     total_files = len(files_to_process)
@@ -316,6 +307,9 @@ def main():
 
             if tools:
                 total_tools = len(tools)
+                # Real tokenizer counts, one batched pass per server
+                for t, n in zip(tools, counter.count_tools(tools)):
+                    t['estimated_tokens'] = n
                 total_tokens = sum(t['estimated_tokens'] for t in tools)
                 
                 server_data = {
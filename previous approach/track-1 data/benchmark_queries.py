@@ -0,0 +1,20 @@
+# Track 1 benchmark: queries and the tool names (substrings) that count as a correct selection.
+# Shared by the retrieval experiment and the offline index/quantization benchmarks.
+
+BENCHMARKS = [
+    {"q": "Find contact details for 'John Doe'", "target": ["search_contacts", "get_contact"]},
+    {"q": "Update opportunity 'Big Deal' to stage 'Closed Won'", "target": ["update_opportunity"]},
+    {"q": "Get salary history for employee 'Alice Smith'", "target": ["get_compensation", "salary"]},
+    {"q": "Submit vacation request for next week", "target": ["submit_time_off", "vacation"]},
+    {"q": "Trigger deployment for 'backend-service' to production", "target": ["trigger_pipeline", "deployment"]},
+    {"q": "Get logs for build #1234", "target": ["get_build_logs", "logs"]},
+    {"q": "Create a high priority ticket for 'Login Failure'", "target": ["create_ticket"]},
+    {"q": "Search knowledge base for 'password reset'", "target": ["search_articles", "knowledge"]},
+    {"q": "Refund charge ch_999999", "target": ["create_refund", "refund"]},
+    {"q": "Get latest invoice for customer 'Acme Corp'", "target": ["list_invoices", "invoice"]},
+    {"q": "Reset password for user 'bob@example.com'", "target": ["reset_password"]},
+    {"q": "Grant 'admin' role to user 'bob'", "target": ["assign_role", "grant"]},
+    {"q": "List all PDF files in /documents", "target": ["list_files"]},
+    {"q": "Share 'report.pdf' with 'team@company.com'", "target": ["share_file"]},
+    {"q": "Send message to #general channel saying 'Hello'", "target": ["post_message", "send_message"]},
+]
@@ -0,0 +1,116 @@
+import os
+import re
+import json
+import fcntl
+import numpy as np
+from vector_index import normalize
+
+# Persistent tool-embedding cache, one directory per embedding model:
+#
+# <root>/<model>/vectors.f16  float16 [rows, dim], unit length, appended back to back
+# <root>/<model>/keys.npy     content hash of each row (S64)
+# <root>/<model>/meta.json    {"model", "dim", "rows", "normalized"}
+#
+# vectors.f16 only ever grows and meta.json/keys.npy are replaced atomically
+# after the rows they describe are on disk, so readers (e.g. serving workers
+# opened with readonly=True) always see a consistent prefix and share the
+# mapped pages. Rows are stored normalized so a FlatIndex can search the map
+# in place. Writers serialize on a lock file. A cache written before rows were
+# normalized is ignored and rebuilt by the next writer.
+
+EMBEDDING_CACHE_DIR = "embedding_cache"
+
+def _model_dir_name(model_name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+
+class EmbeddingCache:
+    def __init__(self, model_name, root=EMBEDDING_CACHE_DIR, readonly=False):
+        self.model_name = model_name
+        self.readonly = readonly
+        self.dir = os.path.join(root, _model_dir_name(model_name))
+        if not readonly:
+            os.makedirs(self.dir, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _load(self):
+        self.dim, self.rows = None, 0
+        self.vectors = None
+        self.row_of = {} # content hash -> row
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        if not meta.get("normalized"):
+            return
+        self.dim, self.rows = meta["dim"], meta["rows"]
+        if self.rows:
+            self.vectors = np.memmap(self._path("vectors.f16"), dtype=np.float16, mode="r", shape=(self.rows, self.dim))
+            keys = np.load(self._path("keys.npy"))[:self.rows]
+            self.row_of = {k.decode("ascii"): r for r, k in enumerate(keys)}
+
+    def __len__(self):
+        return self.rows
+
+    def encode(self, hashes, texts, encode_fn):
+        """
+        Unit-length float16 embeddings, in order, for the given content hashes.
+        Only hashes not yet in the cache have their text encoded, once each; new
+        rows are appended to disk unless the cache is read-only. When the rows
+        sit back to back in the cache (e.g. the catalog that built it), the
+        result is a read-only view of the memory map rather than a copy.
+        """
+        if not len(hashes):
+            return np.zeros((0, self.dim or 0), dtype=np.float16)
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in self.row_of:
+                missing.setdefault(h, text)
+        fresh = {}
+        if missing:
+            print(f"Embedding {len(missing)} new tool texts ({len(hashes) - len(missing)} cached)...")
+            vectors = normalize(encode_fn(list(missing.values()))).astype(np.float16)
+            if self.readonly:
+                fresh = {h: j for j, h in enumerate(missing)}
+            else:
+                self._append(list(missing), vectors)
+        else:
+            print(f"✅ All {len(hashes)} tool embeddings cached.")
+
+        rows = np.array([self.row_of.get(h, -1) for h in hashes], dtype=np.int64)
+        cached = rows >= 0
+        if cached.all() and (len(rows) == 1 or (np.diff(rows) == 1).all()):
+            return self.vectors[rows[0]:rows[-1] + 1]
+        # A read-only cache may have no map at all yet (no writer has built it)
+        source = vectors if fresh else self.vectors
+        out = np.empty((len(hashes), source.shape[1]), dtype=source.dtype)
+        if cached.any():
+            out[cached] = self.vectors[rows[cached]]
+        if fresh:
+            out[~cached] = vectors[[fresh[h] for h, c in zip(hashes, cached) if not c]]
+        return out
+
+    def _append(self, new_hashes, vectors):
+        with open(self._path(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load() # Another writer may have appended since we last looked
+            keep = [i for i, h in enumerate(new_hashes) if h not in self.row_of]
+            if keep:
+                if self.dim is None:
+                    self.dim = vectors.shape[1]
+                with open(self._path("vectors.f16"), "ab") as f:
+                    # Drop any tail a crashed writer left past the last committed row
+                    f.truncate(self.rows * self.dim * 2)
+                    f.seek(0, os.SEEK_END)
+                    f.write(vectors[keep].astype(np.float16).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                keys = np.array([k.encode("ascii") for k in self.row_of] + [new_hashes[i].encode("ascii") for i in keep], dtype="S64")
+                np.save(self._path("keys.tmp.npy"), keys)
+                os.replace(self._path("keys.tmp.npy"), self._path("keys.npy"))
+                with open(self._path("meta.tmp.json"), "w") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim, "rows": len(keys), "normalized": True}, f)
+                os.replace(self._path("meta.tmp.json"), self._path("meta.json"))
+                self._load()
@@ -9,8 +9,8 @@ Features:
 - Parses Python decorators: @mcp.tool(...), @server.tool(), @mcp.tool() with/without description/name.
 - Extracts function name, description (decorator or docstring), parameters (Field(...) info).
 - Parses TypeScript tool arrays: `export const tools = [ {...} ]` and `tools: [ {...} ]` literal objects (inputSchema properties).
-- Estimates tokens per tool using the formula you provided:
-    tokens = 50 + len(description_words)/0.75 + parameter_count * 40
+- Counts tokens per tool with the model tokenizer (see src/aid_framework/token_accounting.py); the old
+  word-count formula (50 + words/0.75 + parameter_count * 40) is only used without one.
 - Categorizes servers into complexity buckets:
     Simple: 1-5 tools
     Medium: 6-20 tools
@@ -30,25 +30,14 @@ import os
 import re
 import sys
 from pathlib import Path
+sys.path.append("../../src/aid_framework")
+from token_accounting import TokenCounter
 
 # Hard-coded configuration
 INPUT_DIR = "./downloaded_server_py"
 OUTPUT_FILE = "mcp_dataset.json"
 VERBOSE = False
 
-BASE_SCHEMA_OVERHEAD = 50
-
-def estimate_tokens(description, parameter_count):
-    """
-    tokens = 50 + len(description_words)/0.75 + (parameter_count * 40)
-    (uses number of words in description)
-    """
-    if not description:
-        desc_words = 0
-    else:
-        desc_words = len(description.split())
-    return int(BASE_SCHEMA_OVERHEAD + (desc_words / 0.75) + (parameter_count * 40))
-
 def has_valid_description(desc):
     """Check if a description is valid (not None, not empty, not 'No description available')"""
     if not desc:
@@ -209,13 +198,11 @@ def extract_python_tools(text):
                     param_count += 1
 
             tool_name = name_override or fname
-            estimated = estimate_tokens(desc, param_count)
             tools.append({
                 "name": tool_name,
                 "description": desc,
                 "parameters": parameters,
-                "parameter_count": param_count,
-                "estimated_tokens": estimated
+                "parameter_count": param_count
             })
             
             i = def_line_idx + 1
@@ -292,13 +279,11 @@ def extract_typescript_tools(text):
                         }
                         param_count += 1
 
-            estimated = estimate_tokens(desc, param_count)
             tools.append({
                 "name": name,
                 "description": desc,
                 "parameters": params,
-                "parameter_count": param_count,
-                "estimated_tokens": estimated
+                "parameter_count": param_count
             })
 
     return tools
@@ -306,7 +291,7 @@ def extract_typescript_tools(text):
 # ----------------------------
 # File processing
 # ----------------------------
-def process_file(path):
+def process_file(path, counter):
     p = Path(path)
     try:
         text = p.read_text(encoding='utf-8')
@@ -322,6 +307,9 @@ def process_file(path):
         return None, None
     if not tools:
         return None, None
+    # One batched tokenizer pass per server
+    for t, n in zip(tools, counter.count_tools(tools)):
+        t['estimated_tokens'] = n
     total_schema_tokens = sum(t['estimated_tokens'] for t in tools)
     complexity = 'simple' if len(tools) <= 5 else ('medium' if len(tools) <= 20 else 'complex')
     return {
@@ -341,6 +329,7 @@ def main():
     input_dir = Path(INPUT_DIR)
     output_file = Path(OUTPUT_FILE)
     verbose = VERBOSE
+    counter = TokenCounter()
 
     all_servers = []
     errors_encountered = []
@@ -353,7 +342,7 @@ def main():
 
     for idx, f in enumerate(files, start=1):
         print(f"Processing file {idx}/{len(files)}: {f}", file=sys.stderr)
-        server_entry, error = process_file(f)
+        server_entry, error = process_file(f, counter)
         if error:
             errors_encountered.append({"file": str(f), "error": error})
             with open('errors.log', 'a', encoding='utf-8') as ef:
@@ -0,0 +1,87 @@
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+
+# Tokenized inverted index with BM25 scoring for ToolDatabase keyword retrieval.
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+STOPWORDS = {"a", "an", "the", "for", "to", "of", "in", "on", "at", "and", "or", "with", "by", "from", "is", "all", "my"}
+
+_CAMEL_BOUNDARY = re.compile(r"([a-z0-9])([A-Z])")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+def _stem(term):
+    # Just enough to match "triggers"/"trigger", "deployments"/"deployment", "listing"/"list"
+    for suffix in ("ing", "ed", "s"):
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3 and not term.endswith("ss"):
+            return term[:-len(suffix)]
+    return term
+
+def tokenize(text):
+    """Lowercased, lightly stemmed terms; snake_case, camelCase and kebab-case identifiers are split."""
+    text = _CAMEL_BOUNDARY.sub(r"\1 \2", str(text))
+    return [_stem(t) for t in _NON_WORD.split(text.lower()) if t and t not in STOPWORDS]
+
+def tool_text(tool):
+    """What a tool is indexed under: its unique name, description and parameter names."""
+    params = tool.get("parameters") or {}
+    return " ".join([tool.get("unique_name", tool.get("name", "")), tool.get("description") or ""] + list(params))
+
+class BM25Index:
+    """
+    Inverted index (term -> {doc_id: term frequency}) scored with BM25. Only the
+    postings of the query terms are touched per search, and top-k is taken with
+    a heap instead of sorting every score. Documents can be added and removed at
+    any time; corpus statistics are kept up to date incrementally.
+    """
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict) # term -> {doc_id: tf}
+        self.doc_len = {}                 # doc_id -> number of terms
+        self.doc_terms = {}               # doc_id -> its distinct terms (for remove)
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, doc_id, text):
+        if doc_id in self.doc_len:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf
+        n = sum(terms.values())
+        self.doc_terms[doc_id] = list(terms)
+        self.doc_len[doc_id] = n
+        self.total_len += n
+
+    def remove(self, doc_id):
+        n = self.doc_len.pop(doc_id, None)
+        if n is None:
+            return
+        self.total_len -= n
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query, top_k=10):
+        """Returns: [(score, doc_id)] of the top_k matching documents, best first."""
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(s, d) for d, s in top]
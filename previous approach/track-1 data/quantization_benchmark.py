@@ -0,0 +1,129 @@
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from vector_index import make_index, normalize
+from tool_catalog import ToolCatalog, scaled_tools
+from embedding_cache import EmbeddingCache
+from benchmark_queries import BENCHMARKS
+from vector_index_benchmark import synthetic_catalog
+
+# Recall loss vs memory and latency of the quantized vector indexes ("int8",
+# "binary") against exact float32 search ("flat"), on the Track 1 catalog and
+# benchmark queries. Catalog embeddings come from the same on-disk cache as
+# ToolDatabase, so re-runs only encode the 15 queries.
+#
+# recall@k:  overlap with the flat top-k
+# target@k:  share of benchmark queries with a correct tool in the top-k
+#            (the retrieval pool the LLM selects from)
+# memory_mb: memory the index allocates itself
+# shared_mb: rows it only references (the float16 embedding cache map,
+#            shared by every worker process)
+#
+# Expected trade-offs: int8 cuts memory 4x but is not faster per query (NumPy
+# has no int8 GEMM, so tiles are widened to float32 and the scan stays
+# memory-bound); binary is the fast one, and its int8 rescorer makes it the
+# largest quantized index unless it rescores against the shared float16 rows
+# ("binary-f16") or skips rescoring ("binary-hamming", lowest recall).
+
+DATASET_PATH = "mcp_dataset_enhanced.json"
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+CATALOG_SIZES = [1000, 10000, 100000]
+BACKENDS = {                        # label -> (index kind, options, add the float16 cache rows by reference)
+    "flat": ("flat", {}, False),
+    "int8": ("int8", {}, False),
+    "binary": ("binary", {}, False),  # int8 rescore
+    "binary-f16": ("binary", {"rescorer": "flat"}, True),
+    "binary-hamming": ("binary", {"rescorer": None}, False)
+}
+TOP_K = 15                 # RETRIEVAL_POOL_SIZE
+REPEATS = 20               # Timed passes over the queries
+OUTPUT_CSV = "results/quantization_benchmark.csv"
+
+def timed_search(index, queries):
+    """Per-query latency (one query at a time, like run_retrieval_agent)."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        ids = [index.search(q, TOP_K)[1][0] for q in queries]
+    return np.array(ids), (time.perf_counter() - start) * 1000 / (REPEATS * len(queries))
+
+def recall_at_k(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+def target_at_k(found, names):
+    hits = [any(t.lower() in names[i].lower() for i in ids for t in b["target"]) for ids, b in zip(found, BENCHMARKS)]
+    return np.mean(hits)
+
+def catalog_vectors(n, embedder):
+    """Embeddings and unique names of the first n (scaled) catalog tools."""
+    with open(DATASET_PATH) as f:
+        servers = json.load(f).get("servers", [])
+    catalog = ToolCatalog()
+    for s_name, tool in scaled_tools(servers, n):
+        catalog.add(s_name, tool)
+    cache = EmbeddingCache(EMBEDDING_MODEL)
+    ids = range(len(catalog))
+    vectors = cache.encode([catalog.content_hashes[i] for i in ids], [catalog.embed_text(i) for i in ids], embedder.encode)
+    return vectors, catalog.unique_names
+
+def run_benchmark(synthetic=False):
+    if synthetic:
+        rng = np.random.default_rng(0)
+    else:
+        from sentence_transformers import SentenceTransformer
+        embedder = SentenceTransformer(EMBEDDING_MODEL)
+        queries = np.asarray(embedder.encode([b["q"] for b in BENCHMARKS]), dtype=np.float32)
+
+    rows = []
+    for n in CATALOG_SIZES:
+        if synthetic:
+            vectors, queries = synthetic_catalog(n, 384, rng)
+            names = None
+        else:
+            vectors, names = catalog_vectors(n, embedder)
+        print(f"\n=== {len(vectors)} tools, {len(queries)} queries ===")
+
+        # What the embedding cache holds (its own rows in the real run)
+        cache_rows = vectors if vectors.dtype == np.float16 else normalize(vectors).astype(np.float16)
+        truth = None
+        for label, (kind, options, by_reference) in BACKENDS.items():
+            index = make_index(kind, vectors.shape[1], **options)
+            start = time.perf_counter()
+            if by_reference:
+                index.add(cache_rows, normalized=True)
+            else:
+                index.add(vectors)
+            build_s = time.perf_counter() - start
+            found, ms = timed_search(index, normalize(queries))
+            if truth is None:
+                truth = found # flat runs first
+            row = {"tools": len(vectors), "backend": label, "memory_mb": index.nbytes / 2**20,
+                   "shared_mb": getattr(index, "shared_nbytes", 0) / 2**20,
+                   "latency_ms": ms, f"recall@{TOP_K}": recall_at_k(found, truth), "build_s": build_s}
+            if names is not None:
+                row[f"target@{TOP_K}"] = target_at_k(found, names)
+            rows.append(row)
+            target = f" | target@{TOP_K}: {row[f'target@{TOP_K}']:.3f}" if names is not None else ""
+            shared = f" (+{row['shared_mb']:.2f} MB shared)" if row["shared_mb"] else ""
+            print(f"   {label:14s} {row['memory_mb']:9.2f} MB{shared} | {ms:.3f} ms/query | recall@{TOP_K}: {row[f'recall@{TOP_K}']:.3f}{target}")
+
+    df = pd.DataFrame(rows)
+    largest = df[df["tools"] == df["tools"].max()].set_index("backend")
+    flat = largest.loc["flat"]
+    print(f"\n=== Trade-offs vs flat at {int(flat['tools'])} tools ===")
+    for label, row in largest.drop(index="flat").iterrows():
+        print(f"   {label:14s} {row['memory_mb'] / flat['memory_mb']:.2f}x memory | "
+              f"{row['latency_ms'] / flat['latency_ms']:.2f}x latency | recall@{TOP_K} {row[f'recall@{TOP_K}']:.3f}")
+    output = OUTPUT_CSV.replace(".csv", "_synthetic.csv") if synthetic else OUTPUT_CSV
+    df.to_csv(output, index=False)
+    print(f"\n📝 Saved results to {output}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall loss vs memory/latency of quantized tool embeddings.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CATALOG_SIZES, help="Catalog sizes (scaled with tenant variants past the real catalog).")
+    parser.add_argument("--synthetic", action="store_true", help="Use synthetic clustered vectors instead of the embedded catalog (no model needed).")
+    args = parser.parse_args()
+    CATALOG_SIZES = args.sizes
+    run_benchmark(args.synthetic)
@@ -0,0 +1,119 @@
+import re
+import time
+import numpy as np
+from collections import OrderedDict
+
+# Cache in front of ToolDatabase retrieval. Agents repeat the same few intents,
+# so both the query embedding and the retrieved ids are kept per normalized
+# query, with a TTL and LRU eviction. Retrieval results are dropped whenever
+# the catalog changes; query embeddings do not depend on it and survive.
+
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL_S = 600
+SEMANTIC_HIT_THRESHOLD = None # Cosine similarity above which a different query reuses a cached result (e.g. 0.97)
+
+_WORD = re.compile(r"\w+")
+
+def normalize_query(query):
+    """Case, whitespace and punctuation insensitive form of a query."""
+    return " ".join(_WORD.findall(query.lower()))
+
+class QueryCache:
+    """
+    Results are stored per (method, normalized query) with the ranked ids and
+    how many were fetched, so a cached top-50 also answers top-15. With a
+    semantic_threshold, a miss whose query embedding is close enough to a
+    cached query of the same method is served from that entry.
+    """
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL_S, semantic_threshold=SEMANTIC_HIT_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.results = OrderedDict()    # (method, normalized query) -> (expires_at, value, fetched_k, unit query embedding)
+        self.embeddings = OrderedDict() # normalized query -> (expires_at, embedding)
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "expired": 0, "evictions": 0,
+                      "invalidations": 0, "embedding_hits": 0, "embedding_misses": 0}
+
+    def _fresh(self, store, key):
+        entry = store.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del store[key]
+            self.stats["expired"] += 1
+            return None
+        store.move_to_end(key)
+        return entry
+
+    def _insert(self, store, key, entry):
+        store[key] = entry
+        store.move_to_end(key)
+        while len(store) > self.max_size:
+            store.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    # --- Query embeddings ---
+
+    def embedding(self, query, encode_fn):
+        """Embedding of query, encoded only on a miss."""
+        key = normalize_query(query)
+        entry = self._fresh(self.embeddings, key)
+        if entry is not None:
+            self.stats["embedding_hits"] += 1
+            return entry[1]
+        self.stats["embedding_misses"] += 1
+        emb = np.asarray(encode_fn([query]), dtype=np.float32)[0]
+        self._insert(self.embeddings, key, (time.monotonic() + self.ttl, emb))
+        return emb
+
+    # --- Retrieval results ---
+
+    def get(self, method, query, top_k, embed=None):
+        """
+        Cached value for (method, query) if it covers top_k, else None.
+        embed: returns the query embedding; only called for near-duplicate lookups.
+        """
+        entry = self._fresh(self.results, (method, normalize_query(query)))
+        if entry is not None and entry[2] >= top_k:
+            self.stats["hits"] += 1
+            return entry[1]
+        if embed is not None and self.semantic_threshold is not None:
+            near = self._nearest(method, embed(), top_k)
+            if near is not None:
+                self.stats["semantic_hits"] += 1
+                return near
+        self.stats["misses"] += 1
+        return None
+
+    def _nearest(self, method, q_emb, top_k):
+        keys = [k for k, e in self.results.items() if k[0] == method and e[3] is not None and e[2] >= top_k]
+        if not keys:
+            return None
+        q = q_emb / max(np.linalg.norm(q_emb), 1e-12)
+        sims = np.stack([self.results[k][3] for k in keys]) @ q
+        best = int(np.argmax(sims))
+        if sims[best] < self.semantic_threshold:
+            return None
+        entry = self._fresh(self.results, keys[best])
+        return entry[1] if entry is not None else None
+
+    def put(self, method, query, top_k, value, q_emb=None):
+        unit = None if q_emb is None else q_emb / max(np.linalg.norm(q_emb), 1e-12)
+        self._insert(self.results, (method, normalize_query(query)), (time.monotonic() + self.ttl, value, top_k, unit))
+
+    def invalidate(self):
+        """Drops every retrieval result (call on any catalog change)."""
+        self.results.clear()
+        self.stats["invalidations"] += 1
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        return (self.stats["hits"] + self.stats["semantic_hits"]) / lookups if lookups else 0.0
+
+    def report(self):
+        s = self.stats
+        embed_lookups = s["embedding_hits"] + s["embedding_misses"]
+        print(f"Query cache: {self.hit_rate():.1%} result hit rate "
+              f"({s['hits']} exact, {s['semantic_hits']} near-duplicate, {s['misses']} misses) | "
+              f"embedding hits {s['embedding_hits']}/{embed_lookups} | "
+              f"{s['expired']} expired, {s['evictions']} evicted, {s['invalidations']} invalidations")
@@ -0,0 +1,103 @@
+import re
+import json
+
+# Tool renderings for LLM prompts, cheapest first:
+#
+# L0  name only            payments-mcp-server__create_refund
+# L1  typed signature      payments-mcp-server__create_refund(charge_id: string, amount?: integer) - Refunds a charge.
+# L2  compact schema       {"name":...,"description":...,"parameters":{...}} - no whitespace, defaults or metadata
+# L3  full schema          the whole tool JSON, indent=2
+#
+# allocate_tiers picks a level per candidate so a tool list fits a token budget:
+# a wide candidate pool at L1 costs about as much as a handful of tools at L3.
+
+L0, L1, L2, L3 = 0, 1, 2, 3
+TIER_NAMES = ["name", "signature", "compact", "full"]
+SIGNATURE_DESC_CHARS = 100     # Description kept on an L1 line (first sentence, capped)
+COMPACT_DROP_KEYS = {"default", "example", "examples", "title"}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+def _name(tool):
+    return tool.get("unique_name", tool.get("name", ""))
+
+def _short_description(description):
+    text = " ".join((description or "").split())
+    text = _SENTENCE_END.split(text, 1)[0]
+    return text if len(text) <= SIGNATURE_DESC_CHARS else text[:SIGNATURE_DESC_CHARS - 3].rstrip() + "..."
+
+def signature(tool):
+    """One line: name(param: type, optional?: type) - first sentence of the description."""
+    params = []
+    for p_name, spec in (tool.get("parameters") or {}).items():
+        spec = spec if isinstance(spec, dict) else {"type": spec}
+        p_type = " ".join(str(spec.get("type", "any")).split())
+        if spec.get("enum"):
+            p_type = "|".join(json.dumps(v) for v in spec["enum"])
+        optional = "" if spec.get("required") else "?"
+        params.append(f"{p_name}{optional}: {p_type}")
+    line = f"{_name(tool)}({', '.join(params)})"
+    description = _short_description(tool.get("description"))
+    return f"{line} - {description}" if description else line
+
+def compact_schema(tool):
+    """Name, description and parameters only (no dataset bookkeeping), minus defaults/examples/titles."""
+    params = {}
+    for p_name, spec in (tool.get("parameters") or {}).items():
+        if isinstance(spec, dict):
+            spec = {k: v for k, v in spec.items() if k not in COMPACT_DROP_KEYS}
+        params[p_name] = spec
+    schema = {"name": _name(tool), "description": tool.get("description") or "", "parameters": params}
+    return json.dumps(schema, separators=(",", ":"))
+
+def render_tool(tool, level):
+    if level == L0:
+        return _name(tool)
+    if level == L1:
+        return signature(tool)
+    if level == L2:
+        return compact_schema(tool)
+    if level == L3:
+        return json.dumps(tool, indent=2)
+    raise ValueError(f"Unknown schema tier {level} (expected {L0}-{L3})")
+
+def render_tool_list(tools, levels):
+    """Prompt block of "- <rendering>" lines."""
+    return "\n".join(f"- {render_tool(t, level)}" for t, level in zip(tools, levels))
+
+def allocate_tiers(tools, budget, counter, min_level=L0, max_level=L3):
+    """
+    Level per tool (tools ranked best first) so render_tool_list fits in budget
+    tokens. Every tool starts at min_level; then, one level at a time, tools
+    are upgraded in rank order while the budget allows, so the whole pool
+    reaches L1 before the top tools get L2, and a better-ranked tool never
+    gets a cheaper rendering than a worse-ranked one. If even min_level does
+    not fit, the lowest-ranked tools are left out.
+    Returns: (tools, levels, tokens) - the tools kept, their levels, and the token total.
+    """
+    tools = list(tools)
+    if not tools:
+        return [], [], 0
+    levels = range(min_level, max_level + 1)
+    lines = [f"- {render_tool(t, level)}\n" for level in levels for t in tools]
+    flat_costs = counter.count_many(lines) # One batched, cached tokenization
+    cost = {level: flat_costs[n * len(tools):(n + 1) * len(tools)] for n, level in enumerate(levels)}
+
+    kept = len(tools)
+    total = sum(cost[min_level])
+    while kept and total > budget:
+        kept -= 1
+        total -= cost[min_level][kept]
+    chosen = [min_level] * kept
+    for level in levels[1:]:
+        upgraded = 0
+        for i in range(kept):
+            extra = cost[level][i] - cost[chosen[i]][i]
+            if total + extra > budget:
+                break
+            chosen[i] = level
+            total += extra
+            upgraded += 1
+        if upgraded < kept:
+            break
+    return tools[:kept], chosen, total
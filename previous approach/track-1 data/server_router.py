@@ -0,0 +1,83 @@
+import numpy as np
+from vector_index import normalize, top_k_rows
+
+# Server-level routing in front of ToolDatabase semantic retrieval. Each server
+# is summarized by the centroid of its tool embeddings; a query is scored
+# against the centroids first and only the tools of the top-m servers are then
+# scored, so per-query cost is ~ servers + tools of m servers instead of every
+# tool in the catalog.
+
+ROUTER_TOP_M = 4     # Servers whose tools are searched
+ROUTER_MIN_Z = 2.0   # Best server score, in std devs above the mean server score, needed to trust the route
+
+class ServerRouter:
+    """
+    Keeps a running sum of unit tool embeddings per server (centroid = its
+    normalized sum) and the live tool ids under each server. Tools can be
+    added and removed incrementally as servers connect and disconnect.
+    """
+    def __init__(self, dim, top_m=ROUTER_TOP_M, min_z=ROUTER_MIN_Z):
+        self.dim = dim
+        self.top_m = top_m
+        self.min_z = min_z
+        self.servers = []  # row -> server name
+        self.row_of = {}   # server name -> row
+        self.sums = np.zeros((0, dim), dtype=np.float32)
+        self.members = []  # row -> live tool ids
+        self.centroids = None # Rebuilt on the first route() after a change
+        self.stats = {"routed": 0, "fallback": 0}
+
+    def __len__(self):
+        return sum(1 for m in self.members if m)
+
+    def add(self, server_name, ids, vectors):
+        row = self.row_of.get(server_name)
+        if row is None:
+            row = len(self.servers)
+            self.row_of[server_name] = row
+            self.servers.append(server_name)
+            self.members.append([])
+            self.sums = np.vstack([self.sums, np.zeros((1, self.dim), dtype=np.float32)])
+        self.sums[row] += normalize(vectors).sum(axis=0)
+        self.members[row].extend(int(i) for i in ids)
+        self.centroids = None
+
+    def remove(self, server_name, ids, vectors=None):
+        """Drops tools from a server; without vectors, drops the whole server."""
+        row = self.row_of.get(server_name)
+        if row is None:
+            return
+        if vectors is None:
+            self.members[row] = []
+        else:
+            drop = set(int(i) for i in ids)
+            self.members[row] = [i for i in self.members[row] if i not in drop]
+            self.sums[row] -= normalize(vectors).sum(axis=0)
+        if not self.members[row]:
+            self.sums[row] = 0 # No float drift left behind in an emptied server
+        self.centroids = None
+
+    def route(self, query):
+        """
+        Returns: (servers, ids, confident) - the top-m servers, best first, the
+        ids of their tools, and whether the best server stands out enough from
+        the rest for the route to be trusted (if not, search every tool).
+        """
+        if self.centroids is None:
+            self.centroids = normalize(self.sums)
+        alive = np.flatnonzero([bool(m) for m in self.members])
+        if not len(alive):
+            return [], np.zeros(0, dtype=np.int64), False
+        scores = self.centroids[alive] @ normalize(query)[0]
+        m = min(self.top_m, len(alive))
+        top_s, top = top_k_rows(scores[None, :], m)
+        rows = alive[top[0]]
+        z = (top_s[0, 0] - scores.mean()) / max(scores.std(), 1e-6)
+        ids = np.concatenate([np.asarray(self.members[r], dtype=np.int64) for r in rows])
+        return [self.servers[r] for r in rows], ids, bool(m < len(alive) and z >= self.min_z)
+
+    def report(self):
+        total = self.stats["routed"] + self.stats["fallback"]
+        share = self.stats["routed"] / total if total else 0.0
+        print(f"Server routing: {share:.1%} of {total} searches routed to the top {self.top_m} of {len(self)} servers "
+              f"({self.stats['fallback']} flat fallbacks)")
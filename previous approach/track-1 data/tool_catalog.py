@@ -0,0 +1,83 @@
+import json
+import hashlib
+from collections import defaultdict
+
+# Columnar tool catalog behind ToolDatabase. Every tool gets a dense integer id
+# (its row); names and descriptions live in per-column lists, and the rest of
+# each definition (parameters, counts, ...) is stored as JSON in one shared
+# byte buffer, sliced by schema_offsets.
+
+def embed_text(unique_name, description):
+    """Text a tool is embedded under for semantic search."""
+    return f"{unique_name} {description}"
+
+class ToolCatalog:
+    def __init__(self):
+        self.unique_names = []
+        self.servers = []
+        self.names = []
+        self.descriptions = []
+        self.content_hashes = []        # sha256 of embed_text, to embed identical content once
+        self.schema_blob = bytearray()
+        self.schema_offsets = [0]       # Row i's schema is schema_blob[offsets[i]:offsets[i + 1]]
+        self.id_of = {}                 # unique_name -> id (latest definition)
+        self.server_ids = defaultdict(list)
+
+    def __len__(self):
+        return len(self.unique_names)
+
+    def __getitem__(self, i):
+        """The tool as a dict (same shape as the dataset's tools, plus unique_name)."""
+        start, end = self.schema_offsets[i], self.schema_offsets[i + 1]
+        tool = {"name": self.names[i], "description": self.descriptions[i]}
+        tool.update(json.loads(self.schema_blob[start:end]))
+        tool["unique_name"] = self.unique_names[i]
+        return tool
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def add(self, server_name, tool):
+        """Appends a tool; returns its id. Re-adding a unique_name points it at the new row."""
+        unique_name = f"{server_name}__{tool['name']}"
+        description = tool.get("description") or ""
+        rest = {k: v for k, v in tool.items() if k not in ("name", "description", "unique_name")}
+        i = len(self.unique_names)
+        self.unique_names.append(unique_name)
+        self.servers.append(server_name)
+        self.names.append(tool["name"])
+        self.descriptions.append(description)
+        self.content_hashes.append(hashlib.sha256(embed_text(unique_name, description).encode("utf-8")).hexdigest())
+        self.schema_blob += json.dumps(rest).encode("utf-8")
+        self.schema_offsets.append(len(self.schema_blob))
+        self.id_of[unique_name] = i
+        self.server_ids[server_name].append(i)
+        return i
+
+    def embed_text(self, i):
+        return embed_text(self.unique_names[i], self.descriptions[i])
+
+def scaled_tools(servers, target_count):
+    """
+    Yields (server_name, tool) until target_count tools. Past the real catalog,
+    each server is replayed as an explicit tenant variant ("<server>-t<k>",
+    descriptions tagged with the tenant), so every tool keeps a distinct
+    unique_name and distinct content instead of aliasing an existing one.
+    """
+    total = sum(len(s.get("tools", [])) for s in servers)
+    if not total:
+        return
+    produced, k = 0, 0
+    while produced < target_count:
+        for server in servers:
+            s_name = server.get("server_name", "unknown")
+            for tool in server.get("tools", []):
+                if produced >= target_count:
+                    return
+                if k:
+                    tool = dict(tool, description=f"{tool.get('description') or ''} [tenant {k}]")
+                    yield f"{s_name}-t{k}", tool
+                else:
+                    yield s_name, tool
+                produced += 1
+        k += 1
@@ -0,0 +1,131 @@
+import re
+import json
+from schema_tiers import L0, L1, L2, render_tool, render_tool_list
+
+# "Search then describe" tool discovery around ToolDatabase. Instead of
+# retrieved schemas being put into the prompt up front, the agent gets two
+# meta-tools: search_tools returns tool names only (L0), and describe_tool
+# returns one compact schema (L2), so a schema only enters the context once the
+# agent means to call that tool. The session runs many tasks: when a task ends
+# its turns are dropped, but the schemas it described stay in the system
+# message, and describing such a tool again returns a one-line reference to
+# the schema already in context instead of a second copy.
+
+SEARCH_TOOLS_TOP_K = 10
+SEARCH_TOOLS_MAX_K = 50  # Cap on a model-supplied top_k
+META_TOOLS = [
+    {"name": "search_tools", "description": "Find tools for a task. Returns tool names only.",
+     "parameters": {"query": {"type": "string", "required": True}, "top_k": {"type": "integer"}}},
+    {"name": "describe_tool", "description": "Schema of one tool. Only describe the tool you are about to call.",
+     "parameters": {"name": {"type": "string", "required": True}}}
+]
+META_TOOL_NAMES = {t["name"] for t in META_TOOLS}
+
+DISCOVERY_SYSTEM_PROMPT = (
+    "You complete tasks by calling tools. Reply with exactly ONE JSON object "
+    '{"tool": <name>, "args": {...}} and nothing else.\n'
+    "Meta-tools:\n" + render_tool_list(META_TOOLS, [L1] * len(META_TOOLS)) + "\n"
+    "To finish a task, call the chosen tool itself by its name with its arguments."
+)
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+def parse_action(text):
+    """(tool, args) from the model's reply, or (None, {}) if it is not a JSON action."""
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return None, {}
+    try:
+        action = json.loads(match.group(0))
+    except ValueError:
+        return None, {}
+    if not isinstance(action, dict) or not isinstance(action.get("tool"), str):
+        return None, {}
+    args = action.get("args")
+    return action["tool"], args if isinstance(args, dict) else {}
+
+class ToolDiscoverySession:
+    """
+    One agent session: its context (messages) and the meta-tool runtime over
+    db. method picks the ToolDatabase retriever behind search_tools
+    ("semantic", "keyword" or "hybrid").
+    """
+    def __init__(self, db, method="semantic", top_k=SEARCH_TOOLS_TOP_K):
+        self.db = db
+        self.method = method
+        self.top_k = top_k
+        self.turns = []        # Messages of the current task
+        self.schemas = {}      # unique name -> schema described in an earlier task
+        self.described = set() # unique names whose schema is already in the context
+        self.stats = {"searches": 0, "describes": 0, "describe_hits": 0, "invalid": 0}
+
+    def _retrieve(self, query, top_k):
+        if self.method == "hybrid":
+            return self.db.retrieve_hybrid(query, top_k=top_k)[0]
+        if self.method == "keyword":
+            return self.db.retrieve_keyword(query, top_k=top_k)
+        return self.db.retrieve_semantic(query, top_k=top_k)
+
+    def search_tools(self, query, top_k=None):
+        if top_k is None:
+            top_k = self.top_k
+        elif isinstance(top_k, bool) or not isinstance(top_k, (int, float, str)):
+            top_k = None
+        else:
+            try:
+                top_k = min(max(int(top_k), 1), SEARCH_TOOLS_MAX_K)
+            except (ValueError, OverflowError):
+                top_k = None
+        if top_k is None:
+            self.stats["invalid"] += 1
+            return f"top_k must be an integer from 1 to {SEARCH_TOOLS_MAX_K}."
+        self.stats["searches"] += 1
+        tools = self._retrieve(str(query), top_k)
+        return "\n".join(render_tool(t, L0) for t in tools) or "No matching tools."
+
+    def describe_tool(self, name):
+        tool = self.db.get_tool(name)
+        if tool is None:
+            return f"Unknown tool '{name}'. Use a name returned by search_tools."
+        self.stats["describes"] += 1
+        if name in self.described:
+            self.stats["describe_hits"] += 1
+            return f"The schema of {name} was already provided above."
+        self.described.add(name)
+        return render_tool(tool, L2)
+
+    def execute(self, tool, args):
+        """Runs a meta-tool call; returns its result text."""
+        if tool == "search_tools":
+            return self.search_tools(args.get("query", ""), args.get("top_k"))
+        if tool == "describe_tool":
+            return self.describe_tool(str(args.get("name", "")))
+        self.stats["invalid"] += 1
+        return 'Reply with one JSON action, e.g. {"tool": "search_tools", "args": {"query": "..."}}.'
+
+    @property
+    def messages(self):
+        system = DISCOVERY_SYSTEM_PROMPT
+        if self.schemas:
+            system += "\n\nTool schemas described earlier:\n" + "\n".join(self.schemas.values())
+        return [{"role": "system", "content": system}] + self.turns
+
+    def add(self, role, content):
+        self.turns.append({"role": role, "content": content})
+
+    def end_task(self):
+        """Drops the finished task's turns; the schemas it described stay in context."""
+        for name in list(self.described):
+            tool = self.db.get_tool(name)
+            if tool is None:
+                # Removed since it was described: drop it from the context too
+                self.described.discard(name)
+                self.schemas.pop(name, None)
+            elif name not in self.schemas:
+                self.schemas[name] = render_tool(tool, L2)
+        self.turns = []
+
+    def report(self):
+        s = self.stats
+        print(f"Tool discovery: {s['searches']} searches, {s['describes']} describes "
+              f"({s['describe_hits']} served from the session cache), {s['invalid']} invalid actions")
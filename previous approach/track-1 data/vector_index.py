@@ -0,0 +1,350 @@
+import numpy as np
+
+# Vector indexes for ToolDatabase semantic retrieval. Vectors are L2-normalized
+# on the way in, so inner product == cosine similarity.
+#
+# add(vectors, normalized=False) appends rows; normalized=True promises they are
+# already unit length (FlatIndex then keeps them by reference, see below).
+# search(queries, top_k) -> (scores, ids), both [n_queries, top_k], best first.
+# score(query, ids) -> scores of one query against the given rows only.
+# ids are positions in insertion order.
+
+IVF_N_PROBE = 8            # Lists scanned per query
+IVF_KMEANS_ITERS = 10
+IVF_TRAIN_SAMPLE = 50000   # Vectors used to fit the centroids
+ASSIGN_BLOCK_SIZE = 8192   # Rows per block when assigning vectors to centroids
+QUERY_BLOCK = 256          # Flat search: queries x tools scored one cache-sized
+TOOL_BLOCK = 4096          # tile (256 x 4096 float32 = 4 MB) at a time
+TILE_SCORES = QUERY_BLOCK * TOOL_BLOCK # Float32 rows: fewer queries get wider tiles of the same size
+INT8_MAX = 127
+BINARY_RESCORE_FACTOR = 10 # Binary search: Hamming shortlist of top_k * factor, rescored exactly
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k_rows(scores, k):
+    """Row-wise top-k of a score matrix without a full sort: argpartition, then sort only k."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(scores.dtype), empty.astype(np.int64)
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+def merge_top_k(scores_a, ids_a, scores_b, ids_b, k):
+    """Row-wise top-k of two partial (scores, ids) results."""
+    s, pos = top_k_rows(np.concatenate([scores_a, scores_b], axis=1), k)
+    return s, np.take_along_axis(np.concatenate([ids_a, ids_b], axis=1), pos, axis=1)
+
+def blocked_search(queries, n, score_tile, k, tool_block=TOOL_BLOCK):
+    """
+    Row-wise top-k over n stored vectors, scored QUERY_BLOCK x tool_block tiles
+    at a time with a running merge. score_tile(q, start, end) -> scores [len(q), end - start].
+    """
+    k = min(k, n)
+    scores = np.empty((len(queries), k), dtype=np.float32)
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    for qs in range(0, len(queries), QUERY_BLOCK):
+        q = queries[qs:qs + QUERY_BLOCK]
+        best_s, best_i = top_k_rows(score_tile(q, 0, tool_block), k)
+        for ts in range(tool_block, n, tool_block):
+            s, i = top_k_rows(score_tile(q, ts, ts + tool_block), k)
+            best_s, best_i = merge_top_k(best_s, best_i, s, i + ts, k)
+        scores[qs:qs + len(q)], ids[qs:qs + len(q)] = best_s, best_i
+    return scores, ids
+
+if hasattr(np, "bitwise_count"): # NumPy >= 2.0: vectorized popcount
+    def popcount_rows(words):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+else:
+    _POPCOUNT = np.array([bin(b).count("1") for b in range(256)], dtype=np.uint8)
+    def popcount_rows(words):
+        return _POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+class FlatIndex:
+    """
+    Exact search: a matrix product against every stored vector, computed in
+    score tiles of at most TILE_SCORES entries with a running row-wise top-k
+    (argpartition, not a full sort), so the full queries x tools score matrix
+    is never materialized.
+    Vectors are kept as a list of chunks, one per add(). Rows added with
+    normalized=True are kept by reference in their own dtype, so a read-only
+    float16 view of the embedding cache's memory map is searched in place and
+    its pages are shared by every process that maps it; anything else is
+    normalized into a private float32 chunk. nbytes counts private chunks
+    only, shared_nbytes the rows kept by reference.
+    """
+    def __init__(self, dim):
+        self.dim = dim
+        self.chunks = []
+        self.shared = []  # Per chunk: kept by reference (not allocated by the index)
+        self.starts = [0] # Id of each chunk's first row; the last entry is len(self)
+
+    def __len__(self):
+        return self.starts[-1]
+
+    @property
+    def nbytes(self):
+        return sum(c.nbytes for c, shared in zip(self.chunks, self.shared) if not shared)
+
+    @property
+    def shared_nbytes(self):
+        return sum(c.nbytes for c, shared in zip(self.chunks, self.shared) if shared)
+
+    def add(self, vectors, normalized=False):
+        if not len(vectors):
+            return
+        self.chunks.append(np.asarray(vectors) if normalized else normalize(vectors))
+        self.shared.append(normalized)
+        self.starts.append(self.starts[-1] + len(vectors))
+
+    def score(self, query, ids):
+        """Scores of one query against the stored rows ids."""
+        ids = np.asarray(ids, dtype=np.int64)
+        query = normalize(query)[0]
+        scores = np.empty(len(ids), dtype=np.float32)
+        chunk_of = np.searchsorted(self.starts, ids, side="right") - 1
+        for c in np.unique(chunk_of):
+            rows = chunk_of == c
+            scores[rows] = self.chunks[c][ids[rows] - self.starts[c]] @ query
+        return scores
+
+    def search(self, queries, top_k):
+        queries = normalize(queries)
+        k = min(top_k, len(self))
+        scores = np.zeros((len(queries), 0), dtype=np.float32)
+        ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for chunk, start in zip(self.chunks, self.starts):
+            # Float32 rows go to BLAS in place, so only the score tile bounds its width and a
+            # single query scores ~1M rows per tile; other dtypes are widened TOOL_BLOCK rows at a time
+            tool_block = TOOL_BLOCK
+            if chunk.dtype == np.float32:
+                tool_block = max(TOOL_BLOCK, TILE_SCORES // max(1, min(len(queries), QUERY_BLOCK)))
+            s, i = blocked_search(queries, len(chunk), lambda q, a, b, c=chunk: q @ c[a:b].T, k, tool_block)
+            scores, ids = merge_top_k(scores, ids, s, i + start, k)
+        return scores, ids
+
+class IVFIndex:
+    """
+    Approximate search with an inverted file: vectors are bucketed under their
+    nearest of n_lists k-means centroids, and a query only scores the vectors of
+    its n_probe nearest lists. Centroids are fitted on the first add(); later
+    vectors are assigned to the existing lists.
+    """
+    def __init__(self, dim, n_lists=None, n_probe=IVF_N_PROBE, seed=0):
+        self.dim = dim
+        self.n_lists = n_lists # None: ~4 * sqrt(N) at training time
+        self.n_probe = n_probe
+        self.seed = seed
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.centroids = None
+        self.lists = []
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def nbytes(self):
+        lists = sum(l.nbytes for l in self.lists)
+        return self.vectors.nbytes + lists + (self.centroids.nbytes if self.centroids is not None else 0)
+
+    def score(self, query, ids):
+        return self.vectors[ids] @ normalize(query)[0]
+
+    def _assign(self, vectors):
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+            block = vectors[start:start + ASSIGN_BLOCK_SIZE]
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, vectors):
+        rng = np.random.default_rng(self.seed)
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        sample = vectors
+        if len(vectors) > IVF_TRAIN_SAMPLE:
+            sample = vectors[rng.choice(len(vectors), IVF_TRAIN_SAMPLE, replace=False)]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        # Spherical k-means: centroids stay unit length, assignment by inner product
+        for _ in range(IVF_KMEANS_ITERS):
+            labels = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = self.centroids[empty] # Empty lists keep their old centroid
+            self.centroids = normalize(sums)
+        self.lists = [np.zeros(0, dtype=np.int64) for _ in range(n_lists)]
+
+    def add(self, vectors, normalized=False):
+        vectors = normalize(vectors)
+        if not len(vectors):
+            return
+        if self.centroids is None:
+            self._train(vectors)
+        ids = np.arange(len(self.vectors), len(self.vectors) + len(vectors))
+        labels = self._assign(vectors)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self.lists) + 1))
+        for c in range(len(self.lists)):
+            new = ids[order[bounds[c]:bounds[c + 1]]]
+            if len(new):
+                self.lists[c] = np.concatenate([self.lists[c], new])
+        self.vectors = np.vstack([self.vectors, vectors])
+
+    def search(self, queries, top_k):
+        queries = normalize(queries)
+        scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+        if self.centroids is None:
+            return scores, ids
+        n_probe = min(self.n_probe, len(self.lists))
+        _, probes = top_k_rows(queries @ self.centroids.T, n_probe)
+        for row, q in enumerate(queries):
+            candidates = np.concatenate([self.lists[c] for c in probes[row]])
+            s, i = top_k_rows((self.vectors[candidates] @ q)[None, :], top_k)
+            scores[row, :s.shape[1]] = s[0]
+            ids[row, :i.shape[1]] = candidates[i[0]]
+        return scores, ids
+
+class Int8Index:
+    """
+    Exact scan over scalar-quantized vectors: each dimension is stored as int8
+    with a per-dimension scale fitted on the first add() (4x smaller than
+    float32). The scale is folded into the query, so a score is
+    (q * scale) @ codes.T. NumPy has no int8 GEMM (an int32 matmul is slower
+    than BLAS), so each TOOL_BLOCK tile of codes is widened into one reused
+    float32 buffer for the BLAS product. A single-query scan is memory-bound
+    and costs about as much as the float32 flat scan; the gain is memory.
+    """
+    def __init__(self, dim):
+        self.dim = dim
+        self.scale = None
+        self.codes = np.zeros((0, dim), dtype=np.int8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def quantize(self, vectors):
+        return np.clip(np.rint(vectors / self.scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+
+    def add(self, vectors, normalized=False):
+        vectors = normalize(vectors)
+        if not len(vectors):
+            return
+        if self.scale is None:
+            # Unit vectors: values outside the fitted range are clipped on later adds
+            self.scale = np.maximum(np.abs(vectors).max(axis=0), 1e-6) / INT8_MAX
+        self.codes = np.vstack([self.codes, self.quantize(vectors)])
+
+    def scale_queries(self, queries):
+        return normalize(queries) * (self.scale if self.scale is not None else 1.0)
+
+    def score(self, query, ids):
+        return self.codes[ids].astype(np.float32) @ self.scale_queries(query)[0]
+
+    def search(self, queries, top_k):
+        queries = self.scale_queries(queries)
+        tile = np.empty((min(TOOL_BLOCK, len(self.codes)), self.dim), dtype=np.float32)
+
+        def score_tile(q, start, end):
+            codes = self.codes[start:end]
+            widened = tile[:len(codes)]
+            np.copyto(widened, codes)
+            return q @ widened.T
+        return blocked_search(queries, len(self.codes), score_tile, top_k)
+
+class BinaryIndex:
+    """
+    One sign bit per dimension, packed into uint64 words (32x smaller than
+    float32). A query is compared to every stored vector by Hamming distance
+    (XOR + popcount), and only the closest top_k * rescore_factor candidates
+    are rescored for the final ranking. rescorer picks what they are rescored
+    against:
+    - "int8": private int8 codes (binary + int8 memory, the most of any index)
+    - "flat": the added rows themselves; with add(..., normalized=True) they
+      are kept by reference (e.g. the shared float16 embedding cache map), so
+      only the bits are private
+    - None: no rescore; Hamming order, scored 1 - 2 * distance / dim
+    """
+    def __init__(self, dim, rescore_factor=BINARY_RESCORE_FACTOR, rescorer="int8"):
+        self.dim = dim
+        self.rescore_factor = rescore_factor
+        self.n_words = (dim + 63) // 64
+        self.bits = np.zeros((0, self.n_words), dtype=np.uint64)
+        self.rescorer = make_index(rescorer, dim) if rescorer else None
+
+    def __len__(self):
+        return len(self.bits)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes + (self.rescorer.nbytes if self.rescorer is not None else 0)
+
+    @property
+    def shared_nbytes(self):
+        return getattr(self.rescorer, "shared_nbytes", 0)
+
+    def pack(self, vectors):
+        packed = np.packbits(vectors > 0, axis=1)
+        padded = np.zeros((len(vectors), self.n_words * 8), dtype=np.uint8)
+        padded[:, :packed.shape[1]] = packed
+        return padded.view(np.uint64)
+
+    def _similarity(self, dist):
+        # Hamming distance -> similarity in [-1, 1] (1: every sign agrees)
+        return 1 - 2 * dist / np.float32(self.dim)
+
+    def score(self, query, ids):
+        if self.rescorer is None:
+            return self._similarity(popcount_rows(self.bits[ids] ^ self.pack(np.atleast_2d(query))))
+        return self.rescorer.score(query, ids)
+
+    def add(self, vectors, normalized=False):
+        if not len(vectors):
+            return
+        # Signs do not depend on the norm, so the bits need no normalized copy
+        self.bits = np.vstack([self.bits, self.pack(np.asarray(vectors))])
+        if self.rescorer is not None:
+            self.rescorer.add(vectors, normalized=normalized)
+
+    def search(self, queries, top_k):
+        queries = normalize(queries)
+        k = min(top_k, len(self.bits))
+        shortlist = min(len(self.bits), k * self.rescore_factor)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        ids = np.empty((len(queries), k), dtype=np.int64)
+        if not k:
+            return scores, ids
+        q_bits = self.pack(queries)
+        for row in range(len(queries)):
+            dist = popcount_rows(self.bits ^ q_bits[row])
+            if self.rescorer is None:
+                candidates = np.argpartition(dist, k - 1)[:k]
+                candidate_scores = self._similarity(dist[candidates])
+            else:
+                candidates = np.argpartition(dist, shortlist - 1)[:shortlist]
+                candidate_scores = self.rescorer.score(queries[row], candidates)
+            s, i = top_k_rows(candidate_scores[None, :], k)
+            scores[row], ids[row] = s[0], candidates[i[0]]
+        return scores, ids
+
+INDEX_BACKENDS = {
+    "flat": FlatIndex,
+    "ivf": IVFIndex,
+    "int8": Int8Index,
+    "binary": BinaryIndex
+}
+
+def make_index(kind, dim, **kwargs):
+    if kind not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown vector index '{kind}' (available: {', '.join(INDEX_BACKENDS)})")
+    return INDEX_BACKENDS[kind](dim, **kwargs)
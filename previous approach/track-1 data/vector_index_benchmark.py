@@ -0,0 +1,113 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+from vector_index import FlatIndex, IVFIndex, normalize, top_k_rows
+
+# Recall@k vs latency of the vector index backends on synthetic tool catalogs.
+# Catalog vectors are drawn around "server" centers (tools of a server embed
+# close together, as they do with the real catalog); queries are noisy copies
+# of random catalog tools. Ground truth is the exact flat search.
+#
+# Exact baselines: "cosine-argsort" is the original retrieve_semantic
+# (sklearn cosine_similarity, which re-normalizes every tool per query, then
+# a full argsort); "argsort" is the same on pre-normalized vectors. The
+# "topk-*" rows time only the top-k selection on one precomputed score
+# vector, where argpartition wins over a full sort as N grows.
+
+CATALOG_SIZES = [1000, 10000, 100000]
+EMBED_DIM = 384            # all-MiniLM-L6-v2
+TOOLS_PER_SERVER = 20
+N_QUERIES = 200
+TOP_K = 10
+N_PROBES = [1, 4, 8, 16, 32]
+OUTPUT_CSV = "results/vector_index_benchmark.csv"
+
+def synthetic_catalog(n, dim, rng):
+    n_servers = max(1, n // TOOLS_PER_SERVER)
+    centers = normalize(rng.standard_normal((n_servers, dim)))
+    tools = centers[rng.integers(0, n_servers, n)] + 1.0 * normalize(rng.standard_normal((n, dim)))
+    queries = tools[rng.integers(0, n, N_QUERIES)] + 0.8 * normalize(rng.standard_normal((N_QUERIES, dim)))
+    return tools.astype(np.float32), queries.astype(np.float32)
+
+def timed_search(index, queries):
+    """Per-query latency (one query at a time, like run_retrieval_agent)."""
+    ids = []
+    start = time.perf_counter()
+    for q in queries:
+        ids.append(index.search(q, TOP_K)[1][0])
+    return np.array(ids), (time.perf_counter() - start) * 1000 / len(queries)
+
+def recall_at_k(found, truth):
+    return np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)])
+
+def run_benchmark():
+    rng = np.random.default_rng(0)
+    rows = []
+    for n in CATALOG_SIZES:
+        tools, queries = synthetic_catalog(n, EMBED_DIM, rng)
+        print(f"\n=== {n} tools ===")
+
+        # Original implementation: cosine_similarity against every tool + full argsort per query
+        start = time.perf_counter()
+        for q in queries:
+            np.argsort(cosine_similarity(q[None, :], tools)[0])[-TOP_K:][::-1]
+        cosine_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"tools": n, "backend": "cosine-argsort", "n_probe": None, "recall@k": 1.0, "latency_ms": cosine_ms, "build_s": 0.0})
+
+        normed = normalize(tools)
+        start = time.perf_counter()
+        for q in queries:
+            np.argsort(normed @ normalize(q)[0])[-TOP_K:][::-1]
+        argsort_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"tools": n, "backend": "argsort", "n_probe": None, "recall@k": 1.0, "latency_ms": argsort_ms, "build_s": 0.0})
+
+        # Top-k selection alone, on one score vector
+        sims = normed @ normalize(queries[0])[0]
+        for backend, select in [("topk-argsort", lambda: np.argsort(sims)[-TOP_K:][::-1]),
+                                ("topk-argpartition", lambda: top_k_rows(sims[None, :], TOP_K))]:
+            start = time.perf_counter()
+            for _ in queries:
+                select()
+            select_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            rows.append({"tools": n, "backend": backend, "n_probe": None, "recall@k": 1.0, "latency_ms": select_ms, "build_s": 0.0})
+
+        flat = FlatIndex(EMBED_DIM)
+        start = time.perf_counter()
+        flat.add(tools)
+        build_s = time.perf_counter() - start
+        truth, flat_ms = timed_search(flat, queries)
+        rows.append({"tools": n, "backend": "flat", "n_probe": None, "recall@k": 1.0, "latency_ms": flat_ms, "build_s": build_s})
+
+        # All queries in one blocked search (retrieve_semantic_batch); latency amortized per query
+        start = time.perf_counter()
+        flat.search(queries, TOP_K)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append({"tools": n, "backend": "flat-batch", "n_probe": None, "recall@k": 1.0, "latency_ms": batch_ms, "build_s": build_s})
+
+        ivf = IVFIndex(EMBED_DIM)
+        start = time.perf_counter()
+        ivf.add(tools)
+        build_s = time.perf_counter() - start
+        for n_probe in N_PROBES:
+            ivf.n_probe = n_probe
+            found, ivf_ms = timed_search(ivf, queries)
+            rows.append({"tools": n, "backend": "ivf", "n_probe": n_probe, "recall@k": recall_at_k(found, truth), "latency_ms": ivf_ms, "build_s": build_s})
+
+        for r in rows:
+            if r["tools"] == n:
+                probe = "" if r["n_probe"] is None else f" (n_probe={r['n_probe']})"
+                print(f"   {r['backend']:17s}{probe:14s} recall@{TOP_K}: {r['recall@k']:.3f} | {r['latency_ms']:.3f} ms/query")
+
+    df = pd.DataFrame(rows)
+    df.to_csv(OUTPUT_CSV, index=False)
+    print(f"\n📝 Saved results to {OUTPUT_CSV}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k vs latency of the ToolDatabase vector indexes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=CATALOG_SIZES, help="Synthetic catalog sizes.")
+    args = parser.parse_args()
+    CATALOG_SIZES = args.sizes
+    run_benchmark()
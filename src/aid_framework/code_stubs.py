@@ -0,0 +1,402 @@
+import re
+import json
+import keyword
+from schema_pruning import RefResolver, iter_operations
+
+# Typed code stubs for tool definitions ("code mode"): the model is shown tools
+# as TypeScript declarations (.d.ts) or Python signatures (.pyi) instead of
+# JSON schemas. Two sources are supported:
+#
+# - MCP servers from mcp_dataset*.json: {"server_name", "tools": [{"name",
+#   "description", "parameters": {name: {"type", "required", ...}}}]}, where
+#   "type" is a JSON type or a Python annotation from the extractor
+# - OpenAPI 3 / Swagger 2 specs: one function per operation, plus a type
+#   declaration for every component/definition the operations reference
+#
+# Each stub keeps names, types, required/optional, defaults and descriptions;
+# bookkeeping (parameter_count, estimated_tokens, formats, bounds) is dropped.
+
+INJECTED_PARAM_TYPES = {"Context"} # Supplied by the MCP runtime, not by the caller
+JSON_CONTENT_TYPES = ("application/json", "*/*")
+DEFINITION_PREFIXES = ("#/components/schemas/", "#/definitions/")
+
+_NOT_IDENTIFIER = re.compile(r"\W+")
+_TS_PROPERTY = re.compile(r"[A-Za-z_$][\w$]*")
+_ANNOTATION_TOKEN = re.compile(r"[\[\],]|[^\[\],]+")
+# The extractor records pydantic Field(...) constants by name, e.g. default "REQUIRED_FIELD_PASSWORD"
+_FIELD_CONSTANT = re.compile(r"^(REQUIRED|OPTIONAL)_FIELD_\w+$")
+
+def identifier(name):
+    """A valid identifier (Python and TypeScript) for an arbitrary name."""
+    ident = _NOT_IDENTIFIER.sub("_", str(name)).strip("_") or "_"
+    if ident[0].isdigit():
+        ident = "_" + ident
+    return ident + "_" if keyword.iskeyword(ident) else ident
+
+def _one_line(text):
+    return " ".join(str(text or "").split())
+
+# --- Python annotations from the MCP extractor ---
+
+def parse_annotation(text):
+    """
+    'Optional[List[str]]' -> ('Optional', [('List', [('str', [])])]).
+    Brackets left open by the extractor's truncation are closed implicitly.
+    """
+    tokens = [t.strip() for t in _ANNOTATION_TOKEN.findall(_one_line(text))]
+    tokens = [t for t in tokens if t]
+
+    def parse(i):
+        if i >= len(tokens) or tokens[i] in ("[", "]", ","):
+            return ("Any", []), i
+        name, i = tokens[i], i + 1
+        args = []
+        if i < len(tokens) and tokens[i] == "[":
+            i += 1
+            while i < len(tokens) and tokens[i] != "]":
+                if tokens[i] == ",":
+                    i += 1
+                    continue
+                arg, i = parse(i)
+                args.append(arg)
+            i += 1
+        return (name, args), i
+    return parse(0)[0]
+
+def _base(name):
+    return name.split(".")[-1] # typing.Optional -> Optional
+
+def _is_injected(spec):
+    t = spec.get("type")
+    if not isinstance(t, str):
+        return False
+    name, args = parse_annotation(t)
+    while _base(name) in ("Optional", "Annotated") and args:
+        name, args = args[0]
+    return _base(name) in INJECTED_PARAM_TYPES
+
+# --- Renderers ---
+
+class StubRenderer:
+    """Shared by the language renderers: $ref handling and nullable schemas."""
+    ANY = NULL = NO_RETURN = None
+
+    def __init__(self, resolver=None):
+        self.resolver = resolver
+
+    def type_of(self, schema):
+        if not isinstance(schema, dict):
+            return self.ANY
+        t = self._type_of(schema)
+        return f"{t} | {self.NULL}" if schema.get("nullable") else t
+
+    def ref_type(self, ref):
+        """Named definitions are referenced by name; anything else is inlined."""
+        if ref.startswith(DEFINITION_PREFIXES):
+            return identifier(ref.rsplit("/", 1)[-1])
+        target = self.resolver.resolve(ref) if self.resolver else None
+        return self.type_of(target) if target is not None else self.ANY
+
+class TypeScriptStubs(StubRenderer):
+    """.d.ts declarations: one namespace per server/spec, keyword-argument objects."""
+    extension = ".d.ts"
+    ANY, NULL, NO_RETURN = "unknown", "null", "void"
+    JSON_TYPES = {"string": "string", "integer": "number", "number": "number", "boolean": "boolean",
+                  "null": "null", "object": "Record<string, unknown>", "array": "unknown[]", "any": "unknown",
+                  "unknown": "unknown"}
+    PY_TYPES = {"str": "string", "int": "number", "float": "number", "bool": "boolean", "bytes": "string",
+                "None": "null", "NoneType": "null", "Any": "unknown", "object": "unknown",
+                "dict": "Record<string, unknown>", "Dict": "Record<string, unknown>", "list": "unknown[]", "List": "unknown[]"}
+
+    @staticmethod
+    def _wrap(t):
+        return f"({t})" if " | " in t or " & " in t else t
+
+    def annotation(self, node):
+        name, args = node
+        base = _base(name)
+        if base == "Annotated" and args:
+            return self.annotation(args[0])
+        if base == "Optional" and args:
+            return f"{self.annotation(args[0])} | null"
+        if base == "Union" and args:
+            return " | ".join(self.annotation(a) for a in args)
+        if base == "Literal" and args:
+            return " | ".join(json.dumps(a[0].strip("'\"")) for a in args)
+        if base in ("List", "list", "Sequence", "Set", "set", "Tuple", "tuple") and args:
+            return f"{self._wrap(self.annotation(args[0]))}[]"
+        if base in ("Dict", "dict", "Mapping") and len(args) == 2:
+            return f"Record<string, {self.annotation(args[1])}>"
+        return self.PY_TYPES.get(base, self.JSON_TYPES.get(base, base))
+
+    def _type_of(self, schema):
+        ref = schema.get("$ref")
+        if isinstance(ref, str):
+            return self.ref_type(ref)
+        if schema.get("enum"):
+            return " | ".join(json.dumps(v) for v in schema["enum"])
+        for key, sep in (("oneOf", " | "), ("anyOf", " | "), ("allOf", " & ")):
+            if schema.get(key):
+                return sep.join(dict.fromkeys(self._wrap(self.type_of(s)) for s in schema[key]))
+        t = schema.get("type")
+        if isinstance(t, list):
+            return " | ".join(self.type_of(dict(schema, type=x)) for x in t)
+        if t == "array":
+            return f"{self._wrap(self.type_of(schema.get('items', {})))}[]"
+        if t == "object" or "properties" in schema:
+            props = schema.get("properties")
+            if props:
+                required = set(schema.get("required") or [])
+                fields = "; ".join(f"{self.property(n)}{'' if n in required else '?'}: {self.type_of(p)}" for n, p in props.items())
+                return "{ " + fields + " }"
+            extra = schema.get("additionalProperties")
+            return f"Record<string, {self.type_of(extra)}>" if isinstance(extra, dict) else self.JSON_TYPES["object"]
+        if isinstance(t, str):
+            return self.JSON_TYPES.get(t) or self.annotation(parse_annotation(t))
+        return self.ANY
+
+    @staticmethod
+    def property(name):
+        return name if _TS_PROPERTY.fullmatch(name) else json.dumps(name)
+
+    @staticmethod
+    def _comment(description, default):
+        notes = [_one_line(description)] if description else []
+        if default is not None:
+            notes.append(f"default: {json.dumps(default)}")
+        return f" // {'; '.join(notes)}" if notes else ""
+
+    def function(self, name, doc, params, returns="unknown", indent=""):
+        """params: [{"name", "schema", "required", "description", "default"}]"""
+        lines = [f"{indent}/** {_one_line(doc)} */"] if doc else []
+        if not params:
+            lines.append(f"{indent}function {name}(): {returns};")
+            return "\n".join(lines)
+        lines.append(f"{indent}function {name}(args: {{")
+        for p in params:
+            optional = "" if p["required"] else "?"
+            comment = self._comment(p.get("description"), p.get("default"))
+            lines.append(f"{indent}  {self.property(p['name'])}{optional}: {self.type_of(p['schema'])};{comment}")
+        lines.append(f"{indent}}}): {returns};")
+        return "\n".join(lines)
+
+    def declaration(self, name, schema, indent=""):
+        if isinstance(schema, dict) and schema.get("properties") and not schema.get("allOf"):
+            required = set(schema.get("required") or [])
+            lines = [f"{indent}interface {name} {{"]
+            for p_name, p in schema["properties"].items():
+                optional = "" if p_name in required else "?"
+                desc = p.get("description") if isinstance(p, dict) else None
+                lines.append(f"{indent}  {self.property(p_name)}{optional}: {self.type_of(p)};{self._comment(desc, None)}")
+            lines.append(f"{indent}}}")
+            return "\n".join(lines)
+        return f"{indent}type {name} = {self.type_of(schema)};"
+
+    def module(self, name, doc, blocks):
+        head = [f"/** {_one_line(doc)} */"] if doc else []
+        return "\n".join(head + [f"declare namespace {name} {{"] + blocks + ["}"])
+
+class PythonStubs(StubRenderer):
+    """.pyi stubs: one module per server/spec, keyword-only parameters, TypedDict declarations."""
+    extension = ".pyi"
+    ANY, NULL, NO_RETURN = "Any", "None", "None"
+    JSON_TYPES = {"string": "str", "integer": "int", "number": "float", "boolean": "bool",
+                  "null": "None", "object": "dict", "array": "list", "any": "Any", "unknown": "Any"}
+
+    BUILTIN_GENERICS = {"List": "list", "Dict": "dict", "Set": "set", "Tuple": "tuple", "Type": "type"}
+
+    def annotation(self, node):
+        """Normalized to builtins and | unions, so stubs only need the typing names module() imports."""
+        name, args = node
+        base = _base(name)
+        if base == "Annotated" and args:
+            return self.annotation(args[0])
+        if base == "Optional" and args:
+            return f"{self.annotation(args[0])} | None"
+        if base == "Union" and args:
+            return " | ".join(self.annotation(a) for a in args)
+        name = self.BUILTIN_GENERICS.get(base, self.JSON_TYPES.get(name, name))
+        return f"{name}[{', '.join(self.annotation(a) for a in args)}]" if args else name
+
+    def _type_of(self, schema):
+        ref = schema.get("$ref")
+        if isinstance(ref, str):
+            return self.ref_type(ref)
+        if schema.get("enum"):
+            return f"Literal[{', '.join(repr(v) for v in schema['enum'])}]"
+        for key in ("oneOf", "anyOf"):
+            if schema.get(key):
+                return " | ".join(dict.fromkeys(self.type_of(s) for s in schema[key]))
+        if schema.get("allOf"):
+            parts = list(dict.fromkeys(self.type_of(s) for s in schema["allOf"]))
+            return parts[0] if len(parts) == 1 else "dict"
+        t = schema.get("type")
+        if isinstance(t, list):
+            return " | ".join(self.type_of(dict(schema, type=x)) for x in t)
+        if t == "array":
+            return f"list[{self.type_of(schema.get('items', {}))}]"
+        if t == "object" or "properties" in schema:
+            extra = schema.get("additionalProperties")
+            return f"dict[str, {self.type_of(extra)}]" if isinstance(extra, dict) else "dict"
+        if isinstance(t, str):
+            return self.JSON_TYPES.get(t) or self.annotation(parse_annotation(t))
+        return self.ANY
+
+    def function(self, name, doc, params, returns="Any", indent=""):
+        args = []
+        for p in params:
+            arg = f"{identifier(p['name'])}: {self.type_of(p['schema'])}"
+            if not p["required"]:
+                arg += f" = {p['default']!r}" if p.get("default") is not None else " = ..."
+            args.append(arg)
+        signature = f"{indent}def {name}({'*, ' if args else ''}{', '.join(args)}) -> {returns}:"
+        notes = [f"{identifier(p['name'])}: {_one_line(p['description'])}" for p in params if p.get("description")]
+        if not doc and not notes:
+            return f"{signature} ..."
+        body = _one_line(doc)
+        if notes:
+            body = "\n".join([body, ""] + [f"{indent}    {n}" for n in notes] + [f"{indent}    "])
+        return f'{signature}\n{indent}    """{body}"""'
+
+    def declaration(self, name, schema, indent=""):
+        if not isinstance(schema, dict):
+            return f"{indent}{name} = {self.ANY}"
+        # allOf of named definitions and inline objects -> TypedDict inheritance
+        parts = list(schema.get("allOf") or []) + [{k: v for k, v in schema.items() if k != "allOf"}]
+        bases = [self.ref_type(p["$ref"]) for p in parts if isinstance(p, dict) and isinstance(p.get("$ref"), str)]
+        props = {}
+        for p in parts:
+            if isinstance(p, dict) and "$ref" not in p:
+                props.update(p.get("properties") or {})
+        if props or bases:
+            lines = [f"{indent}class {name}({', '.join(bases) or 'TypedDict'}, total=False):"]
+            if not props:
+                lines.append(f"{indent}    ...")
+            for p_name, p in props.items():
+                desc = p.get("description") if isinstance(p, dict) else None
+                comment = f"  # {_one_line(desc)}" if desc else ""
+                lines.append(f"{indent}    {identifier(p_name)}: {self.type_of(p)}{comment}")
+            return "\n".join(lines)
+        return f"{indent}{name} = {self.type_of(schema)}"
+
+    def module(self, name, doc, blocks):
+        head = f'"""{name}: {_one_line(doc)}"""' if doc else f'"""{name}"""'
+        return "\n".join([head, "from typing import Any, Literal, TypedDict", ""] + blocks)
+
+STUB_RENDERERS = {
+    "ts": TypeScriptStubs,
+    "py": PythonStubs
+}
+
+def make_renderer(lang, resolver=None):
+    if lang not in STUB_RENDERERS:
+        raise ValueError(f"Unknown stub language '{lang}' (available: {', '.join(STUB_RENDERERS)})")
+    return STUB_RENDERERS[lang](resolver)
+
+# --- MCP tools ---
+
+def mcp_params(tool):
+    params = []
+    for p_name, spec in (tool.get("parameters") or {}).items():
+        spec = spec if isinstance(spec, dict) else {"type": spec}
+        if _is_injected(spec):
+            continue
+        required, default = bool(spec.get("required")), spec.get("default")
+        constant = _FIELD_CONSTANT.match(default) if isinstance(default, str) else None
+        if constant:
+            required, default = constant.group(1) == "REQUIRED", None
+        params.append({"name": p_name, "schema": spec, "required": required,
+                       "description": spec.get("description"), "default": default})
+    return params
+
+def mcp_tool_stub(tool, lang="ts"):
+    """A single tool as a standalone declaration."""
+    stub = make_renderer(lang).function(identifier(tool["name"]), tool.get("description"), mcp_params(tool))
+    if lang == "ts":
+        stub = re.sub(r"^function ", "declare function ", stub, count=1, flags=re.M)
+    return stub
+
+def mcp_server_stubs(server, lang="ts"):
+    """Every tool of an MCP server as one namespace (.d.ts) or module (.pyi)."""
+    renderer = make_renderer(lang)
+    indent = "  " if lang == "ts" else ""
+    blocks = [renderer.function(identifier(t["name"]), t.get("description"), mcp_params(t), indent=indent)
+              for t in server.get("tools", [])]
+    return renderer.module(identifier(server.get("server_name", "server")), None, blocks)
+
+# --- OpenAPI operations ---
+
+def operation_name(path, method, op):
+    return identifier(op.get("operationId") or f"{method} {path}")
+
+def _resolved(node, resolver):
+    seen = set()
+    while isinstance(node, dict) and isinstance(node.get("$ref"), str) and not node["$ref"].startswith(DEFINITION_PREFIXES):
+        if node["$ref"] in seen:
+            break
+        seen.add(node["$ref"])
+        node = resolver.resolve(node["$ref"]) or {}
+    return node
+
+def _json_schema(content):
+    """Schema of the JSON (or first) media type of an OpenAPI 3 content map."""
+    if not isinstance(content, dict) or not content:
+        return None
+    for media in JSON_CONTENT_TYPES:
+        if media in content:
+            return content[media].get("schema")
+    return next(iter(content.values())).get("schema")
+
+def operation_params(path_item, op, resolver):
+    merged = {}
+    for p in list(path_item.get("parameters", [])) + list(op.get("parameters", [])):
+        p = _resolved(p, resolver)
+        if isinstance(p, dict) and "name" in p:
+            merged[(p["name"], p.get("in"))] = p # Operation-level entries override path-level ones
+    params = []
+    for (name, location), p in merged.items():
+        if location == "body": # Swagger 2
+            params.append({"name": "body", "schema": p.get("schema", {}), "required": bool(p.get("required")),
+                           "description": p.get("description")})
+            continue
+        schema = p.get("schema") or {k: p[k] for k in ("type", "items", "enum") if k in p}
+        params.append({"name": name, "schema": schema, "required": bool(p.get("required")) or location == "path",
+                       "description": p.get("description"), "default": schema.get("default", p.get("default"))})
+    body = _resolved(op.get("requestBody"), resolver)
+    if isinstance(body, dict) and body:
+        params.append({"name": "body", "schema": _json_schema(body.get("content")) or {},
+                       "required": bool(body.get("required")), "description": body.get("description")})
+    return params
+
+def operation_returns(op, renderer, resolver):
+    for status, response in (op.get("responses") or {}).items():
+        if not str(status).startswith("2"):
+            continue
+        response = _resolved(response, resolver)
+        if not isinstance(response, dict):
+            continue
+        schema = response.get("schema") or _json_schema(response.get("content")) # Swagger 2 / OpenAPI 3
+        return renderer.type_of(schema) if schema else renderer.NO_RETURN
+    return renderer.ANY
+
+def openapi_stubs(spec, lang="ts", operations=None):
+    """
+    Stubs for a spec's operations (all, or only the (path, method) pairs in
+    operations), preceded by declarations of the definitions they reference.
+    """
+    resolver = RefResolver(spec)
+    renderer = make_renderer(lang, resolver)
+    indent = "  " if lang == "ts" else ""
+    selected = [(p, m, op) for p, m, op in iter_operations(spec) if operations is None or (p, m) in operations]
+
+    refs = resolver.closure([op for _, _, op in selected] + [spec["paths"][p].get("parameters", []) for p, _, _ in selected])
+    blocks = []
+    for ref in sorted(r for r in refs if r.startswith(DEFINITION_PREFIXES)):
+        blocks.append(renderer.declaration(identifier(ref.rsplit("/", 1)[-1]), resolver.resolve(ref), indent=indent))
+    for path, method, op in selected:
+        doc = op.get("summary") or op.get("description") or f"{method.upper()} {path}"
+        params = operation_params(spec["paths"][path], op, resolver)
+        blocks.append(renderer.function(operation_name(path, method, op), doc, params,
+                                        operation_returns(op, renderer, resolver), indent=indent))
+    info = spec.get("info", {})
+    return renderer.module(identifier(info.get("title", "api")), info.get("description"), blocks)
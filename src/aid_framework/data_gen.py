@@ -1,20 +1,32 @@
 import json
 import random
 import os
+import argparse
 import pandas as pd
 from tqdm import tqdm
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
+from schema_pruning import RefResolver, HTTP_METHODS
+from spec_store import SpecStore
 
 # Configuration
 INPUT_FILE = "../../data/track1_dataset.jsonl"
 OUTPUT_FILE = "../../data/aid_training_data.jsonl"
 MODEL_ID = "Qwen/Qwen2.5-14B-Instruct" 
 
+QUERY_MAX_NEW_TOKENS = 50
+CONSTRAINTS_MAX_NEW_TOKENS = 100
+BATCH_SIZE = 16           # Upper bound; shrunk to fit free GPU memory (see fit_batch_size)
+GPU_MEMORY_FRACTION = 0.8 # Share of free GPU memory the KV-cache of one batch may use
+
 def load_model():
     print("⏳ Loading local model for data generation...")
     try:
         tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, trust_remote_code=True)
+        # Batched generation: pad on the left so every prompt ends where decoding starts
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
         model = AutoModelForCausalLM.from_pretrained(
             MODEL_ID, 
             device_map="auto", 
@@ -26,67 +38,205 @@ def load_model():
         print(f"⚠️ Failed to load model: {e}")
         return None, None
 
-def generate_synthetic_data(tokenizer, model, summary, full_spec):
+def fit_batch_size(model, requested, tokens_per_sample=1500):
+    """
+    Largest batch size <= requested whose KV-cache fits in the free GPU memory.
+    tokens_per_sample is a rough upper bound on prompt + generated tokens.
     """
-    Uses the Teacher Model to generate:
+    if not model or not torch.cuda.is_available():
+        return requested
+    cfg = model.config
+    head_dim = getattr(cfg, "head_dim", None) or cfg.hidden_size // cfg.num_attention_heads
+    kv_heads = getattr(cfg, "num_key_value_heads", None) or cfg.num_attention_heads
+    bytes_per_token = 2 * cfg.num_hidden_layers * kv_heads * head_dim * torch.finfo(model.dtype).bits // 8
+    free, _ = torch.cuda.mem_get_info()
+    fits = int(free * GPU_MEMORY_FRACTION // (bytes_per_token * tokens_per_sample))
+    return max(1, min(requested, fits))
+
+def _generate_batch(tokenizer, model, conversations, max_new_tokens):
+    texts = [tokenizer.apply_chat_template(c, tokenize=False, add_generation_prompt=True) for c in conversations]
+    inputs = tokenizer(texts, return_tensors="pt", padding=True).to(model.device)
+    with torch.no_grad():
+        out = model.generate(
+            inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_new_tokens=max_new_tokens,
+            pad_token_id=tokenizer.pad_token_id
+        )
+    return tokenizer.batch_decode(out[:, inputs.input_ids.shape[1]:], skip_special_tokens=True)
+
+def generate_synthetic_batch(tokenizer, model, items):
+    """
+    Uses the Teacher Model to generate, for each (summary, spec fragment) item:
     1. A natural language query.
     2. A list of safety constraints (logic).
+    All queries share one padded generate call, all constraint lists another.
+    Returns: list of (query, constraints), in input order.
     """
     if not model:
-        return "Interact with endpoint", ["constraint1"]
-        
+        return [("Interact with endpoint", ["constraint1"]) for _ in items]
+
     # 1. Generate Query
-    prompt_q = [
+    prompts_q = [[
         {"role": "system", "content": "Generate a natural language query for this API endpoint. Return ONLY the query."},
         {"role": "user", "content": f"Endpoint: {summary}"}
-    ]
-    text_q = tokenizer.apply_chat_template(prompt_q, tokenize=False, add_generation_prompt=True)
-    inputs_q = tokenizer([text_q], return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        out_q = model.generate(inputs_q.input_ids, max_new_tokens=50)
-    query = tokenizer.batch_decode(out_q[:, inputs_q.input_ids.shape[1]:], skip_special_tokens=True)[0].strip('"')
+    ] for summary, _ in items]
+    queries = [q.strip('"') for q in _generate_batch(tokenizer, model, prompts_q, QUERY_MAX_NEW_TOKENS)]
 
     # 2. Extract Constraints (Neuro-Symbolic)
     # We ask the model to identify logical constraints from the spec/summary
-    prompt_c = [
+    prompts_c = [[
         {"role": "system", "content": "Extract logical safety constraints from this API description. Return a JSON list of strings. Example: [\"age >= 18\", \"end_date > start_date\"]"},
-        {"role": "user", "content": f"Description: {summary}\nSpec Fragment: {json.dumps(full_spec)[:1000]}"}
-    ]
-    text_c = tokenizer.apply_chat_template(prompt_c, tokenize=False, add_generation_prompt=True)
-    inputs_c = tokenizer([text_c], return_tensors="pt").to(model.device)
-    with torch.no_grad():
-        out_c = model.generate(inputs_c.input_ids, max_new_tokens=100)
-    constraints_str = tokenizer.batch_decode(out_c[:, inputs_c.input_ids.shape[1]:], skip_special_tokens=True)[0]
-    
-    try:
-        constraints = json.loads(constraints_str)
-        if not isinstance(constraints, list): constraints = []
-    except:
-        constraints = []
-        
-    return query, constraints
+        {"role": "user", "content": f"Description: {summary}\nSpec Fragment: {json.dumps(fragment)[:1000]}"}
+    ] for summary, fragment in items]
 
-def extract_minimal_schema(full_spec, target_path, target_method):
-    # (Same as before: prune everything except target)
+    results = []
+    for query, constraints_str in zip(queries, _generate_batch(tokenizer, model, prompts_c, CONSTRAINTS_MAX_NEW_TOKENS)):
+        try:
+            constraints = json.loads(constraints_str)
+            if not isinstance(constraints, list): constraints = []
+        except:
+            constraints = []
+        results.append((query, constraints))
+    return results
+
+def generate_synthetic_data(tokenizer, model, summary, full_spec):
+    """Single-item convenience wrapper around generate_synthetic_batch."""
+    return generate_synthetic_batch(tokenizer, model, [(summary, full_spec)])[0]
+
+def extract_minimal_schema(full_spec, target_path, target_method, resolver=None):
+    # Prune everything except the target and the definitions it transitively references.
+    # Pass one RefResolver per spec when extracting several operations from it.
+    resolver = resolver or RefResolver(full_spec)
+    path_item = full_spec["paths"][target_path]
+    # Path-level entries (shared parameters, servers, ...) stay with the path, as in prune_schema
+    kept = {k: v for k, v in path_item.items() if k not in HTTP_METHODS}
+    kept[target_method] = path_item[target_method]
+    reachable = resolver.reachable_definitions(kept)
     minimal = {
         "openapi": full_spec.get("openapi", "3.0.0"),
-        "paths": {target_path: {target_method: full_spec["paths"][target_path][target_method]}},
-        "components": full_spec.get("components", {}) # simplified
+        "paths": {target_path: kept},
+        "components": reachable.pop("components", {})
     }
+    minimal.update(reachable) # Swagger 2 definitions/parameters/responses
     return minimal
 
-def process_data():
-    if not os.path.exists(INPUT_FILE):
-        print("❌ Dataset index not found. Run dataset_prep.py first (from Track 1, now reused).")
+def read_manifest(manifest_path):
+    """Checkpoint entries of a shard manifest, without any torn final line."""
+    entries = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break # Torn final line from a crash
+    return entries
+
+class ShardWriter:
+    """
+    Append-only JSONL writer with a checkpoint manifest (`<path>.manifest`).
+    Each manifest line records the operation keys of one flushed batch and the
+    output size after it. On resume the output is truncated back to the last
+    checkpoint, so a crash mid-write never leaves partial or unrecorded records.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.manifest_path = path + ".manifest"
+        entries = []
+        if not os.path.exists(self.manifest_path) and os.path.exists(path) and os.path.getsize(path):
+            # Old-format or merged output: never ours to truncate
+            raise FileExistsError(f"{path} exists but has no manifest; move it aside before generating into it.")
+        if os.path.exists(self.manifest_path):
+            entries = read_manifest(self.manifest_path)
+        self.done = {tuple(k) for e in entries for k in e["keys"]}
+        offset = entries[-1]["offset"] if entries else 0
+
+        if os.path.exists(path) and os.path.getsize(path) > offset:
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        # Rewrite the manifest without any torn tail before appending to it
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            for e in entries:
+                f.write(json.dumps(e) + "\n")
+
+        self.out = open(path, 'a', encoding='utf-8')
+        self.manifest = open(self.manifest_path, 'a', encoding='utf-8')
+        self.written = 0
+
+    def write(self, keyed_records):
+        """Appends [(key, record)] and checkpoints them once they are on disk."""
+        for _, record in keyed_records:
+            self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        # One line per batch, so a checkpoint is either fully recorded or torn (and dropped)
+        keys = [list(key) for key, _ in keyed_records]
+        self.manifest.write(json.dumps({"keys": keys, "offset": self.out.tell()}) + "\n")
+        self.manifest.flush()
+        self.done.update(tuple(k) for k in keys)
+        self.written += len(keyed_records)
+
+    def close(self):
+        self.out.close()
+        self.manifest.close()
+
+def shard_output_path(shard_index, shard_count):
+    if shard_count == 1:
+        return OUTPUT_FILE
+    base, ext = os.path.splitext(OUTPUT_FILE)
+    return f"{base}.shard-{shard_index:03d}-of-{shard_count:03d}{ext}"
+
+def merge_shards(shard_count):
+    """
+    Concatenates every shard's checkpointed output, in shard order, into
+    OUTPUT_FILE. Each shard is copied only up to its last manifest offset, so a
+    crashed shard's torn tail never reaches the merge. The merge is written to
+    a temp file and swapped in, so OUTPUT_FILE is never left half-written, and
+    nothing is replaced unless every shard is present.
+    """
+    paths = [shard_output_path(i, shard_count) for i in range(shard_count)]
+    if shard_count < 2 or OUTPUT_FILE in paths:
+        print(f"❌ Nothing to merge: pass --shard I/N with N > 1 (got N={shard_count}).")
+        return
+    missing = [p for p in paths if not (os.path.exists(p) and os.path.exists(p + ".manifest"))]
+    if missing:
+        print(f"❌ Missing shards, {OUTPUT_FILE} left unchanged: {', '.join(missing)}")
+        return
+    total = 0
+    tmp_path = OUTPUT_FILE + ".tmp"
+    try:
+        with open(tmp_path, 'wb') as out:
+            for path in paths:
+                entries = read_manifest(path + ".manifest")
+                remaining = entries[-1]["offset"] if entries else 0
+                with open(path, 'rb') as f:
+                    while remaining:
+                        block = f.read(min(remaining, 1 << 20))
+                        if not block:
+                            raise ValueError(f"{path} is shorter than its manifest")
+                        out.write(block)
+                        remaining -= len(block)
+                total += sum(len(e["keys"]) for e in entries)
+        os.replace(tmp_path, OUTPUT_FILE)
+    except BaseException as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not isinstance(e, ValueError):
+            raise
+        print(f"❌ {e}; {OUTPUT_FILE} left unchanged.")
         return
+    print(f"✅ Merged {total} AID training examples into {OUTPUT_FILE}")
 
-    df = pd.read_json(INPUT_FILE, lines=True)
-    tokenizer, model = load_model()
-    
-    training_data = []
-    
-    print(f"⏳ Generating AID training pairs...")
-    for _, row in tqdm(df.iterrows(), total=len(df)):
+def iter_work_items(df, store, done=(), shard_index=0, shard_count=1):
+    """
+    Producer stage: yields one work item per sampled (spec, path, method), in
+    index order, without calling the teacher. Only rows belonging to this
+    shard are read, and operations already in `done` are skipped. Each spec
+    that yields work is written once to the content-addressed store.
+    """
+    for pos, (_, row) in enumerate(tqdm(df.iterrows(), total=len(df))):
+        if pos % shard_count != shard_index:
+            continue
         spec_path = row['spec_path']
         try:
             with open(spec_path, 'r', encoding='utf-8') as f:
@@ -97,33 +247,118 @@ def process_data():
         paths = spec.get('paths', {})
         if not paths: continue
         
-        targets = random.sample(list(paths.keys()), min(2, len(paths)))
+        # Seeded per spec so a resumed run samples the same operations
+        targets = random.Random(spec_path).sample(list(paths.keys()), min(2, len(paths)))
+        resolver = RefResolver(spec)
+        spec_hash = None
         
         for path in targets:
             methods = paths[path]
             for method in methods:
                 if method not in ['get', 'post', 'put', 'delete']: continue
                 
+                key = (spec_path, path, method)
+                if key in done: continue
+
+                if spec_hash is None:
+                    spec_hash = store.put(spec)
+
                 summary = methods[method].get('summary', methods[method].get('description', f"{method.upper()} {path}"))
-                
-                # Generate Query & Constraints
-                query, constraints = generate_synthetic_data(tokenizer, model, summary, methods[method])
-                
-                # Minimal Schema
-                minimal_schema = extract_minimal_schema(spec, path, method)
-                
-                # Unified Output Format
-                # We train the model to output: <MINIMAL_JSON> <CONSTRAINTS_JSON>
-                target_output = json.dumps(minimal_schema) + "\nCONSTRAINTS:\n" + json.dumps(constraints)
-                
-                training_data.append({
-                    "query": query,
-                    "full_schema": json.dumps(spec),
-                    "target_output": target_output
-                })
-                
-    pd.DataFrame(training_data).to_json(OUTPUT_FILE, orient='records', lines=True)
-    print(f"✅ Saved {len(training_data)} AID training examples to {OUTPUT_FILE}")
+                yield {
+                    "key": key,
+                    "spec": spec,
+                    "spec_hash": spec_hash,
+                    "path": path,
+                    "method": method,
+                    "summary": summary,
+                    "resolver": resolver
+                }
+
+def run_teacher(tokenizer, model, items, state):
+    """
+    Consumer stage for one batch. On CUDA OOM the batch is split in half and the
+    shared batch size shrinks for the rest of the run.
+    """
+    try:
+        return generate_synthetic_batch(tokenizer, model, [(it["summary"], it["spec"]["paths"][it["path"]][it["method"]]) for it in items])
+    except torch.cuda.OutOfMemoryError:
+        torch.cuda.empty_cache()
+        if len(items) == 1:
+            raise
+        state["batch_size"] = max(1, len(items) // 2)
+        print(f"⚠️ OOM, reducing batch size to {state['batch_size']}")
+        mid = len(items) // 2
+        return run_teacher(tokenizer, model, items[:mid], state) + run_teacher(tokenizer, model, items[mid:], state)
+
+def build_record(item, query, constraints):
+    # Minimal Schema
+    minimal_schema = extract_minimal_schema(item["spec"], item["path"], item["method"], item["resolver"])
+
+    # Unified Output Format
+    # We train the model to output: <MINIMAL_JSON> <CONSTRAINTS_JSON>
+    target_output = json.dumps(minimal_schema) + "\nCONSTRAINTS:\n" + json.dumps(constraints)
+
+    return {
+        "query": query,
+        "schema_hash": item["spec_hash"], # Full schema lives once in the SpecStore
+        "path": item["path"],
+        "method": item["method"],
+        "target_output": target_output
+    }
+
+def process_data(batch_size=BATCH_SIZE, shard_index=0, shard_count=1):
+    if not os.path.exists(INPUT_FILE):
+        print("❌ Dataset index not found. Run dataset_prep.py first (from Track 1, now reused).")
+        return
+
+    df = pd.read_json(INPUT_FILE, lines=True)
+    try:
+        writer = ShardWriter(shard_output_path(shard_index, shard_count))
+    except FileExistsError as e:
+        print(f"❌ {e}")
+        return
+    if writer.done:
+        print(f"⏩ Resuming {writer.path}: {len(writer.done)} operations already done.")
+
+    tokenizer, model = load_model()
+    state = {"batch_size": fit_batch_size(model, batch_size)}
+    print(f"⏳ Generating AID training pairs (shard {shard_index}/{shard_count}, batch size {state['batch_size']})...")
+
+    pending = []
+    items = iter_work_items(df, SpecStore(), writer.done, shard_index, shard_count)
+    try:
+        while True:
+            # Refill up to the current (possibly shrunk) batch size
+            while len(pending) < state["batch_size"]:
+                item = next(items, None)
+                if item is None:
+                    break
+                pending.append(item)
+            if not pending:
+                break
+            batch, pending = pending[:state["batch_size"]], pending[state["batch_size"]:]
+            results = run_teacher(tokenizer, model, batch, state)
+            writer.write([(item["key"], build_record(item, query, constraints))
+                          for item, (query, constraints) in zip(batch, results)])
+    finally:
+        writer.close()
+
+    print(f"✅ Saved {writer.written} new AID training examples to {writer.path} ({len(writer.done)} total)")
+
+def parse_shard(value):
+    index, count = (int(x) for x in value.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {count}), got {value}")
+    return index, count
 
 if __name__ == "__main__":
-    process_data()
+    parser = argparse.ArgumentParser(description="Generate AID distiller training data with the teacher model.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Max teacher batch size (shrunk to fit GPU memory).")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), metavar="I/N", help="Process only rows i, i+n, ... of the index (0-based).")
+    parser.add_argument("--merge", action="store_true", help="Concatenate the N (> 1) shard outputs into the final output file and exit.")
+    args = parser.parse_args()
+    shard_index, shard_count = args.shard
+    if args.merge:
+        merge_shards(shard_count)
+    else:
+        process_data(batch_size=args.batch_size, shard_index=shard_index, shard_count=shard_count)
@@ -1,17 +1,134 @@
+import os
+import json
+import copy
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, DynamicCache, StoppingCriteria, StoppingCriteriaList, LogitsProcessorList
 from peft import PeftModel, PeftConfig
-import json
+from prompts import build_prompt, build_schema_prefix, build_query_suffix
+from output_grammar import DistillOutputGrammar, DistillLogitsProcessor, build_token_strs
+from schema_pruning import prune_schema, PRUNE_TOP_K
+from spec_store import SpecStore
 
 # Configuration
 BASE_MODEL_ID = "Qwen/Qwen2.5-14B-Instruct"
 ADAPTER_PATH = "../../models/aid_distiller"
+MAX_NEW_TOKENS = 512
+MAX_BATCH_SIZE = 8      # Max requests decoded together by the scheduler
+BATCH_WAIT_MS = 10      # How long the scheduler waits to fill a micro-batch
+PREFIX_CACHE_BUDGET_MB = 2048  # KV-cache memory reserved for prefilled schema prefixes (0 disables)
+CONSTRAINED_DECODING = True    # Mask tokens that would break the output grammar (see output_grammar.py)
+PRE_PRUNE = True               # Lexically pre-prune large schemas to PRUNE_TOP_K operations before the LLM
+
+def _cache_nbytes(past_key_values):
+    total = 0
+    for layer in past_key_values:
+        for t in layer:
+            if torch.is_tensor(t):
+                total += t.numel() * t.element_size()
+    return total
+
+class PrefixKVCache:
+    """
+    LRU of prefilled past_key_values for the schema portion of the prompt,
+    keyed by schema hash and bounded by a total memory budget.
+    """
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self.entries = OrderedDict() # key -> (prefix_ids, past_key_values, nbytes)
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self.entries # Peek: no hit/miss accounting, no LRU update
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    def put(self, key, prefix_ids, past_key_values):
+        nbytes = _cache_nbytes(past_key_values)
+        if nbytes > self.budget_bytes:
+            return # Would evict everything else and still not fit
+        if key in self.entries:
+            self.used_bytes -= self.entries.pop(key)[2]
+        while self.entries and self.used_bytes + nbytes > self.budget_bytes:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.used_bytes -= evicted
+        self.entries[key] = (prefix_ids, past_key_values, nbytes)
+        self.used_bytes += nbytes
+
+class _DecodeTracker(StoppingCriteria):
+    """
+    Parses every row's output incrementally after each decode step.
+    - Reports the minimal schema (on_schema) the moment its JSON object closes.
+    - Stops the row and resolves it (on_finished) once the constraints list
+      closes or the row emits EOS, so nobody pays for trailing tokens or waits
+      for the longest sequence in the batch.
+    Rows whose output stops matching the expected format are only ended by EOS
+    or the token budget.
+    """
+    def __init__(self, tokenizer, eos_token_ids, prompt_len, batch_size, on_finished, on_schema):
+        self.tokenizer = tokenizer
+        self.eos_token_ids = eos_token_ids
+        self.prompt_len = prompt_len
+        self.on_finished = on_finished
+        self.on_schema = on_schema
+        self.grammars = [DistillOutputGrammar() for _ in range(batch_size)]
+        self.fed = [0] * batch_size
+        self.schema_sent = [False] * batch_size
+        self.done = set()
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = []
+        for i in range(input_ids.shape[0]):
+            if i not in self.done and input_ids.shape[1] > self.prompt_len:
+                self._step(i, input_ids[i, self.prompt_len:])
+            stop.append(i in self.done)
+        return torch.tensor(stop, dtype=torch.bool, device=input_ids.device)
+
+    def _step(self, i, generated_ids):
+        if generated_ids[-1].item() in self.eos_token_ids:
+            self.done.add(i)
+            self.on_finished(i, generated_ids)
+            return
+        grammar = self.grammars[i]
+        if grammar is None:
+            return
+
+        # Drop a trailing partial UTF-8 character; it is fed once complete
+        text = self.tokenizer.decode(generated_ids, skip_special_tokens=True).rstrip("\ufffd")
+        if not grammar.feed(text[self.fed[i]:]):
+            self.grammars[i] = None
+            return
+        self.fed[i] = len(text)
+
+        if grammar.schema_end is not None and not self.schema_sent[i]:
+            self.schema_sent[i] = True
+            self.on_schema(i, text[:grammar.schema_end])
+        if grammar.is_complete:
+            self.done.add(i)
+            self.on_finished(i, generated_ids)
 
 class InterfaceDistiller:
     def __init__(self):
         print("⏳ Loading Distiller Model...")
         self.tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL_ID, trust_remote_code=True)
-        
+        # Left padding keeps every prompt flush against its first generated token
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
         # Load Base Model
         self.base_model = AutoModelForCausalLM.from_pretrained(
             BASE_MODEL_ID,
@@ -19,7 +136,7 @@ class InterfaceDistiller:
             torch_dtype=torch.float16,
             trust_remote_code=True
         )
-        
+
         # Load Adapter
         if os.path.exists(ADAPTER_PATH):
             self.model = PeftModel.from_pretrained(self.base_model, ADAPTER_PATH)
@@ -28,39 +145,263 @@ class InterfaceDistiller:
             print("⚠️ Adapter not found. Using base model (Zero-shot).")
             self.model = self.base_model
 
-    def distill(self, query, full_schema):
+        # Micro-batching scheduler (started lazily on first request)
+        self._requests = queue.Queue()
+        self._scheduler = None
+        self._scheduler_lock = threading.Lock()
+
+        self.prefix_cache = None
+        if PREFIX_CACHE_BUDGET_MB > 0:
+            self.prefix_cache = PrefixKVCache(PREFIX_CACHE_BUDGET_MB * 1024 * 1024)
+
+        self._token_strs = None # Decoded vocab for constrained decoding, built on first use
+        self.spec_store = SpecStore()
+
+    def _eos_token_ids(self):
+        eos = self.model.generation_config.eos_token_id
+        eos = set(eos if isinstance(eos, list) else [eos])
+        eos.add(self.tokenizer.eos_token_id)
+        return sorted(e for e in eos if e is not None)
+
+    def _logits_processors(self, batch):
+        if not CONSTRAINED_DECODING:
+            return None
+        if self._token_strs is None:
+            self._token_strs = build_token_strs(self.tokenizer)
+        return LogitsProcessorList([
+            DistillLogitsProcessor([item[1] for item in batch], self._token_strs, self._eos_token_ids())
+        ])
+
+    @staticmethod
+    def _prefix_key(schema_str):
+        return hashlib.sha256(schema_str.encode("utf-8")).hexdigest()
+
+    def _prefill_prefix(self, schema_str):
         """
-        Returns: (Minimal Schema JSON, Constraints List)
+        Returns (prefix_ids, past_key_values) for the schema head of the prompt,
+        prefilling it only on a cache miss.
         """
-        prompt = f"Instruction: Distill this interface for query: \"{query}\"\nFull Schema: {json.dumps(full_schema)}\n\nDistilled Interface: "
-        
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        
+        key = self._prefix_key(schema_str)
+        cached = self.prefix_cache.get(key)
+        if cached is not None:
+            return cached
+
+        prefix_ids = self.tokenizer(build_schema_prefix(schema_str), return_tensors="pt").input_ids.to(self.model.device)
         with torch.no_grad():
-            outputs = self.model.generate(inputs.input_ids, max_new_tokens=512, temperature=0.1)
-            
-        response = self.tokenizer.decode(outputs[0][inputs.input_ids.shape[1]:], skip_special_tokens=True)
-        
+            out = self.model(prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        self.prefix_cache.put(key, prefix_ids, out.past_key_values)
+        return prefix_ids, out.past_key_values
+
+    def _prepare_inputs(self, batch, use_prefix=False):
+        """
+        Builds (input_ids, attention_mask, past_key_values) for a batch.
+        With use_prefix (every request shares one schema), only the query
+        suffixes are new tokens; the schema KV comes from the prefix cache.
+        """
+        schema_strs = [json.dumps(item[1]) for item in batch]
+        if not use_prefix:
+            prompts = [build_prompt(item[0], s) for item, s in zip(batch, schema_strs)]
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+            return inputs.input_ids, inputs.attention_mask, None
+
+        prefix_ids, prefix_kv = self._prefill_prefix(schema_strs[0])
+        suffixes = self.tokenizer(
+            [build_query_suffix(item[0]) for item in batch],
+            return_tensors="pt", padding=True, add_special_tokens=False
+        ).to(self.model.device)
+        n = len(batch)
+        # Left padding of the suffixes lands between prefix and query; it is masked
+        # out and position ids are derived from the attention mask, so it is inert.
+        input_ids = torch.cat([prefix_ids.expand(n, -1), suffixes.input_ids], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(n, -1), suffixes.attention_mask], dim=1)
+        # generate() extends the cache in place, so work on a copy
+        past_key_values = copy.deepcopy(prefix_kv)
+        if n > 1:
+            past_key_values.batch_repeat_interleave(n)
+        return input_ids, attention_mask, past_key_values
+
+    def _parse_response(self, response, full_schema):
         # Parse Output
         # Expected format: <JSON> \nCONSTRAINTS:\n <JSON_LIST>
+        parts = response.split("CONSTRAINTS:", 1)
         try:
-            parts = response.split("CONSTRAINTS:")
             minimal_schema = json.loads(parts[0].strip())
-            constraints = []
-            if len(parts) > 1:
-                constraints = json.loads(parts[1].strip())
         except:
             print(f"⚠️ Failed to parse output:\n{response}")
             return full_schema, [] # Fallback
-            
+
+        # A truncated constraints list shouldn't cost us the distilled schema
+        constraints = []
+        if len(parts) > 1:
+            try:
+                constraints = json.loads(parts[1].strip())
+            except:
+                print(f"⚠️ Failed to parse constraints:\n{parts[1]}")
+
         return minimal_schema, constraints
 
+    def _run_batch(self, batch):
+        """
+        Decodes a list of (query, full_schema, future, on_schema, shared).
+        With the prefix cache enabled, a shared (unpruned) schema gets its own
+        prefix-reusing decode only when that pays off: several requests share
+        it, its prefix is already cached, or it is the only schema in the
+        batch. Everything else, including every query-specific pruned schema,
+        is decoded together in one left-padded batch, so a mix of one-off
+        schemas still costs a single generate call.
+        """
+        if self.prefix_cache is None:
+            self._generate(batch)
+            return
+        groups = OrderedDict()
+        padded = []
+        for item in batch:
+            if item[4]:
+                groups.setdefault(json.dumps(item[1]), []).append(item)
+            else:
+                padded.append(item)
+        for schema_str, group in groups.items():
+            if len(group) > 1 or (len(groups) == 1 and not padded) or self._prefix_key(schema_str) in self.prefix_cache:
+                self._generate(group, use_prefix=True)
+            else:
+                padded.extend(group)
+        if padded:
+            self._generate(padded)
+
+    def _generate(self, batch, use_prefix=False):
+        """
+        Decodes a list of (query, full_schema, future, on_schema, shared) together.
+        Futures are resolved as soon as their own sequence is finished.
+        """
+        input_ids, attention_mask, past_key_values = self._prepare_inputs(batch, use_prefix)
+        prompt_len = input_ids.shape[1]
+
+        def finish(i, generated_ids):
+            query, full_schema, future = batch[i][:3]
+            if future.done():
+                return
+            response = self.tokenizer.decode(generated_ids, skip_special_tokens=True)
+            future.set_result(self._parse_response(response, full_schema))
+
+        def schema_ready(i, schema_text):
+            on_schema = batch[i][3]
+            if on_schema is None:
+                return
+            try:
+                on_schema(json.loads(schema_text))
+            except ValueError:
+                pass # Final parse in finish() still reports it
+
+        tracker = _DecodeTracker(self.tokenizer, self._eos_token_ids(), prompt_len, len(batch), finish, schema_ready)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                max_new_tokens=MAX_NEW_TOKENS,
+                logits_processor=self._logits_processors(batch),
+                temperature=0.1,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([tracker])
+            )
+
+        # Sequences that ran out of budget without finishing
+        for i in range(len(batch)):
+            if i not in tracker.done:
+                finish(i, outputs[i, prompt_len:])
+
+    def _scheduler_loop(self):
+        while True:
+            batch = [self._requests.get()]
+            # Collect whatever else arrives within the batching window
+            while len(batch) < MAX_BATCH_SIZE:
+                try:
+                    batch.append(self._requests.get(timeout=BATCH_WAIT_MS / 1000))
+                except queue.Empty:
+                    break
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for item in batch:
+                    future = item[2]
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _ensure_scheduler(self):
+        with self._scheduler_lock:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._scheduler_loop, daemon=True)
+                self._scheduler.start()
+
+    def _submit(self, query, full_schema, on_schema=None):
+        if isinstance(full_schema, str):
+            # SpecStore hash instead of an inline schema
+            full_schema = self.spec_store.get(full_schema)
+        shared = True
+        if PRE_PRUNE:
+            # Small schemas come back unchanged, so they still share a cached prefix;
+            # pruned ones depend on the query and are never worth prefilling
+            pruned = prune_schema(query, full_schema, PRUNE_TOP_K)
+            shared = pruned is full_schema
+            full_schema = pruned
+        self._ensure_scheduler()
+        future = Future()
+        self._requests.put((query, full_schema, future, on_schema, shared))
+        return future
+
+    def distill_batch(self, requests):
+        """
+        Queues (query, full_schema) pairs on the micro-batching scheduler.
+        full_schema may be a dict or a SpecStore hash (as in training rows).
+        Concurrent callers are grouped into shared left-padded batches.
+        Returns: list of Futures, each resolving to (Minimal Schema JSON, Constraints List)
+        """
+        return [self._submit(query, full_schema) for query, full_schema in requests]
+
+    def distill(self, query, full_schema):
+        """
+        Returns: (Minimal Schema JSON, Constraints List)
+        """
+        return self._submit(query, full_schema).result()
+
+    def distill_stream(self, query, full_schema):
+        """
+        Yields ("schema", Minimal Schema JSON) as soon as the schema object is complete,
+        then ("constraints", Constraints List) once the list closes and decoding stops.
+        """
+        events = queue.Queue()
+        future = self._submit(query, full_schema, on_schema=lambda schema: events.put(("schema", schema)))
+        future.add_done_callback(lambda f: events.put(("done", None)))
+
+        schema_sent = False
+        while True:
+            kind, payload = events.get()
+            if kind == "schema":
+                schema_sent = True
+                yield "schema", payload
+                continue
+            minimal_schema, constraints = future.result()
+            if not schema_sent:
+                yield "schema", minimal_schema
+            yield "constraints", constraints
+            return
+
 if __name__ == "__main__":
     # Test
     distiller = InterfaceDistiller()
     q = "Get price of AAPL"
     schema = {"paths": {"/price": {"get": {"description": "Get stock price"}}, "/history": {"get": {"description": "Get history"}}}}
-    
+
     mini, const = distiller.distill(q, schema)
     print("Minimal:", json.dumps(mini, indent=2))
     print("Constraints:", const)
+
+    # Batched: both queries share a single decode
+    futures = distiller.distill_batch([(q, schema), ("Show AAPL history for last month", schema)])
+    for f in futures:
+        mini, const = f.result()
+        print("Minimal:", json.dumps(mini), "| Constraints:", const)
+
+    # Streaming: schema arrives before constraint extraction finishes
+    for kind, payload in distiller.distill_stream(q, schema):
+        print(f"[{kind}]", json.dumps(payload))
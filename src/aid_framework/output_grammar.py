@@ -0,0 +1,326 @@
+import re
+import json
+import torch
+from transformers import LogitsProcessor
+
+# Distiller output format (see data_gen.py):
+#   <MINIMAL_SCHEMA_JSON>\nCONSTRAINTS:\n<JSON_LIST_OF_STRINGS>
+CONSTRAINTS_SEPARATOR = "\nCONSTRAINTS:\n"
+MAX_WHITESPACE_RUN = 8  # Stops the model from burning its budget on indentation
+CANDIDATES_PER_STEP = 32 # Top-scoring tokens checked against the grammar before a full scan
+
+_NUMBER_PARTIAL = re.compile(r"-?|-?(0|[1-9]\d*)(\.\d*)?|-?(0|[1-9]\d*)(\.\d+)?[eE][+-]?\d*")
+_NUMBER_FULL = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+_HEX = set("0123456789abcdefABCDEF")
+
+class DistillOutputGrammar:
+    """
+    Incremental character-level recognizer for the distiller output.
+
+    The minimal schema must be a JSON object whose `paths` (an object of path
+    item objects) keys exist in the input schema, and whose method keys exist
+    under that path. It is followed by
+    the CONSTRAINTS separator and a JSON list of strings.
+
+    `feed()` returns False as soon as the text can no longer be completed into a
+    valid output; the instance must not be reused after that (use `copy()` to probe).
+    """
+    def __init__(self, full_schema=None):
+        self.allowed_keys = {}  # frame label -> (set of escaped keys, set of their prefixes)
+        if full_schema is not None:
+            paths = full_schema.get("paths", {}) if isinstance(full_schema, dict) else {}
+            self._allow("paths", paths.keys())
+            for path, methods in paths.items():
+                if isinstance(methods, dict):
+                    self._allow(("path", _escape(path)), methods.keys())
+
+        self.phase = "schema"   # schema -> separator -> constraints -> done
+        self.stack = []         # [kind, state, label, pending_key]
+        self.token = None       # In-progress scalar: [type, buffer, extra]
+        self.ws_run = 0
+        self.sep_pos = 0
+        self.schema_end = None  # Number of chars consumed when the schema object closed
+        self.consumed = 0
+
+    def _allow(self, label, keys):
+        escaped = {_escape(k) for k in keys}
+        prefixes = {k[:i] for k in escaped for i in range(len(k) + 1)}
+        self.allowed_keys[label] = (escaped, prefixes)
+
+    def copy(self):
+        other = DistillOutputGrammar.__new__(DistillOutputGrammar)
+        other.allowed_keys = self.allowed_keys  # Shared, read-only
+        other.phase = self.phase
+        other.stack = [list(f) for f in self.stack]
+        other.token = list(self.token) if self.token else None
+        other.ws_run = self.ws_run
+        other.sep_pos = self.sep_pos
+        other.schema_end = self.schema_end
+        other.consumed = self.consumed
+        return other
+
+    @property
+    def is_complete(self):
+        return self.phase == "done"
+
+    def feed(self, text):
+        for ch in text:
+            if not self._feed_char(ch):
+                return False
+            self.consumed += 1
+        return True
+
+    # --- Character dispatch ---
+
+    def _feed_char(self, ch):
+        if self.phase == "done":
+            return False
+        if self.phase == "separator":
+            if ch != CONSTRAINTS_SEPARATOR[self.sep_pos]:
+                return False
+            self.sep_pos += 1
+            if self.sep_pos == len(CONSTRAINTS_SEPARATOR):
+                self.phase = "constraints"
+            return True
+
+        if self.token is not None:
+            kind = self.token[0]
+            if kind == "str":
+                return self._feed_string(ch)
+            if kind == "lit":
+                return self._feed_literal(ch)
+            if kind == "num":
+                if _NUMBER_PARTIAL.fullmatch(self.token[1] + ch):
+                    self.token[1] += ch
+                    return True
+                if not _NUMBER_FULL.fullmatch(self.token[1]):
+                    return False
+                self.token = None
+                self._value_done()
+                # Terminating char still needs handling in container context
+
+        if ch in " \t\n\r":
+            if not self.stack:
+                return False
+            self.ws_run += 1
+            return self.ws_run <= MAX_WHITESPACE_RUN
+        self.ws_run = 0
+
+        if not self.stack:
+            # Top level: schema must be an object, constraints must be a list
+            if self.phase == "schema" and ch == "{":
+                self.stack.append(["obj", "key_or_end", "root", None])
+                return True
+            if self.phase == "constraints" and ch == "[":
+                self.stack.append(["arr", "value_or_end", "strings", None])
+                return True
+            return False
+
+        frame = self.stack[-1]
+        kind, state = frame[0], frame[1]
+        if kind == "obj":
+            if state in ("key_or_end", "key") and ch == '"':
+                self.token = ["str", "", 0, True]
+                return True
+            if state == "key_or_end" and ch == "}":
+                return self._close()
+            if state == "colon" and ch == ":":
+                frame[1] = "value"
+                return True
+            if state == "comma_or_end":
+                if ch == ",":
+                    frame[1] = "key"
+                    return True
+                if ch == "}":
+                    return self._close()
+                return False
+            if state == "value":
+                return self._start_value(ch, self._child_label(frame))
+            return False
+
+        # Array
+        if state == "comma_or_end":
+            if ch == ",":
+                frame[1] = "value"
+                return True
+            if ch == "]":
+                return self._close()
+            return False
+        if state == "value_or_end" and ch == "]":
+            return self._close()
+        if frame[2] == "strings" and ch != '"':
+            return False
+        return self._start_value(ch, None)
+
+    def _child_label(self, frame):
+        label, key = frame[2], frame[3]
+        if label == "root" and key == "paths":
+            return "paths"
+        if label == "paths":
+            return ("path", key)
+        return None
+
+    def _start_value(self, ch, label):
+        if label is not None and ch != "{":
+            return False # `paths` and each path item must be objects
+        if ch == "{":
+            self.stack.append(["obj", "key_or_end", label, None])
+            return True
+        if ch == "[":
+            self.stack.append(["arr", "value_or_end", None, None])
+            return True
+        if ch == '"':
+            self.token = ["str", "", 0, False]
+            return True
+        if ch in "-0123456789":
+            self.token = ["num", ch, None]
+            return True
+        if ch in _LITERALS:
+            self.token = ["lit", _LITERALS[ch][1:], None]
+            return True
+        return False
+
+    def _feed_literal(self, ch):
+        rest = self.token[1]
+        if not rest or ch != rest[0]:
+            return False
+        self.token[1] = rest[1:]
+        if not self.token[1]:
+            self.token = None
+            self._value_done()
+        return True
+
+    def _feed_string(self, ch):
+        # token = ["str", raw buffer, escape state, is_key]
+        # escape state: 0 = none, -1 = after backslash, n > 0 = hex digits left
+        esc = self.token[2]
+        if esc == -1:
+            if ch not in '"\\/bfnrtu':
+                return False
+            self.token[2] = 4 if ch == "u" else 0
+        elif esc > 0:
+            if ch not in _HEX:
+                return False
+            self.token[2] = esc - 1
+        elif ch == '"':
+            is_key, raw = self.token[3], self.token[1]
+            self.token = None
+            if is_key:
+                frame = self.stack[-1]
+                allowed = self.allowed_keys.get(frame[2])
+                if allowed is not None and raw not in allowed[0]:
+                    return False
+                frame[1], frame[3] = "colon", raw
+                return True
+            self._value_done()
+            return True
+        elif ch == "\\":
+            self.token[2] = -1
+        elif ord(ch) < 0x20:
+            return False
+
+        self.token[1] += ch
+        if self.token[3]:
+            allowed = self.allowed_keys.get(self.stack[-1][2])
+            if allowed is not None and self.token[1] not in allowed[1]:
+                return False
+        return True
+
+    def _close(self):
+        self.stack.pop()
+        self._value_done()
+        return True
+
+    def _value_done(self):
+        if self.stack:
+            self.stack[-1][1] = "comma_or_end"
+        elif self.phase == "schema":
+            self.phase = "separator"
+            self.schema_end = self.consumed + 1
+        else:
+            self.phase = "done"
+
+def _escape(key):
+    return json.dumps(key)[1:-1]
+
+class DistillLogitsProcessor(LogitsProcessor):
+    """
+    Masks every token that would take a row's output outside DistillOutputGrammar.
+    EOS is only allowed (and then forced) once the constraints list has closed.
+
+    `token_strs` is the decoded text of every vocab id (see `build_token_strs`).
+    """
+    def __init__(self, schemas, token_strs, eos_token_ids):
+        self.grammars = [DistillOutputGrammar(s) for s in schemas]
+        self.token_strs = token_strs
+        self.eos_token_ids = list(eos_token_ids)
+        self.prompt_len = None
+        self.finished = [False] * len(schemas)
+        self.first_char_index = {}
+        for tok_id, text in enumerate(token_strs):
+            if text:
+                self.first_char_index.setdefault(text[0], []).append(tok_id)
+
+    def __call__(self, input_ids, scores):
+        if self.prompt_len is None:
+            self.prompt_len = input_ids.shape[1]
+        else:
+            for row, tok in enumerate(input_ids[:, -1].tolist()):
+                if self.finished[row]:
+                    continue
+                if tok in self.eos_token_ids or not self.grammars[row].feed(self._text(tok)):
+                    # EOS, or the grammar was already exhausted: nothing left to constrain
+                    self.finished[row] = True
+
+        mask = torch.full_like(scores, float("-inf"))
+        for row in range(scores.shape[0]):
+            if self.finished[row]:
+                mask[row] = 0
+                continue
+            grammar = self.grammars[row]
+            if grammar.is_complete:
+                mask[row, self.eos_token_ids] = 0
+                continue
+            allowed = self._allowed_tokens(grammar, scores[row])
+            mask[row, allowed] = 0
+        return scores + mask
+
+    def _text(self, tok):
+        return self.token_strs[tok] if tok < len(self.token_strs) else ""
+
+    def _valid(self, grammar, tok):
+        text = self._text(tok)
+        return bool(text) and grammar.copy().feed(text)
+
+    def _allowed_tokens(self, grammar, row_scores):
+        k = min(CANDIDATES_PER_STEP, row_scores.shape[0])
+        top = torch.topk(row_scores, k).indices.tolist()
+        allowed = [t for t in top if self._valid(grammar, t)]
+        if allowed:
+            return allowed
+
+        # Nothing plausible in the top-k: scan only tokens whose first char can follow
+        candidates = []
+        for ch, ids in self.first_char_index.items():
+            if grammar.copy().feed(ch):
+                candidates.extend(ids)
+        if candidates:
+            ids = torch.tensor(candidates, device=row_scores.device)
+            order = torch.argsort(row_scores[ids], descending=True)
+            for t in ids[order].tolist():
+                if self._valid(grammar, t):
+                    return [t]
+        return self.eos_token_ids
+
+def build_token_strs(tokenizer):
+    """
+    Decoded text of every vocab id. Tokens that decode to partial UTF-8 bytes are
+    left empty (never allowed): targets are json.dumps output and therefore ASCII.
+    """
+    special = set(tokenizer.all_special_ids)
+    strs = []
+    for tok_id in range(len(tokenizer)):
+        text = "" if tok_id in special else tokenizer.decode([tok_id])
+        strs.append("" if "�" in text or not text.isascii() else text)
+    return strs
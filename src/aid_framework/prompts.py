@@ -0,0 +1,19 @@
+# Shared prompt layout for the AID distiller (used by train.py and inference.py).
+#
+# The full schema comes first and the query last, so every request against the
+# same server shares an identical token prefix whose KV-cache can be reused.
+
+# Bump whenever the layout below changes; adapters and caches built for an older
+# version won't line up with the new prompts.
+PROMPT_TEMPLATE_VERSION = 2
+
+def build_schema_prefix(schema_str):
+    """Query-independent head of the prompt. `schema_str` is the JSON-encoded full schema."""
+    return f"Instruction: Distill this interface for the query below.\nFull Schema: {schema_str}\n\n"
+
+def build_query_suffix(query):
+    """Per-request tail of the prompt."""
+    return f"Query: \"{query}\"\n\nDistilled Interface: "
+
+def build_prompt(query, schema_str):
+    return build_schema_prefix(schema_str) + build_query_suffix(query)
@@ -0,0 +1,232 @@
+import re
+import math
+from collections import Counter
+
+# Deterministic (non-LLM) schema pruning used ahead of the distiller and when
+# building training targets.
+
+PRUNE_TOP_K = 8 # Operations kept by the pre-pruner (shared by train.py and inference.py)
+# Bump whenever the pruning output changes (kept path entries, $ref closure, ...);
+# token caches built from older prunes no longer match the prompts.
+PRUNING_VERSION = 2
+SWAGGER2_DEFINITION_CONTAINERS = ("definitions", "parameters", "responses", "securityDefinitions")
+HTTP_METHODS = ("get", "post", "put", "patch", "delete", "head", "options", "trace")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_CAMEL_BOUNDARY = re.compile(r"([a-z0-9])([A-Z])")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+def tokenize(text):
+    """Lowercased word tokens; camelCase, snake_case and path segments are split."""
+    text = _CAMEL_BOUNDARY.sub(r"\1 \2", str(text))
+    return [t for t in _NON_WORD.split(text.lower()) if t]
+
+# --- $ref closure ---
+
+def collect_refs(node, refs=None):
+    """All local `$ref` targets ("#/...") appearing anywhere under node."""
+    if refs is None:
+        refs = set()
+    if isinstance(node, dict):
+        ref = node.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/"):
+            refs.add(ref)
+        for value in node.values():
+            collect_refs(value, refs)
+    elif isinstance(node, list):
+        for value in node:
+            collect_refs(value, refs)
+    return refs
+
+def collect_security_names(node, names=None):
+    """Scheme names used by security requirements (`security: [{name: scopes}]`) anywhere under node."""
+    if names is None:
+        names = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "security" and isinstance(value, list):
+                names.update(name for req in value if isinstance(req, dict) for name in req)
+            else:
+                collect_security_names(value, names)
+    elif isinstance(node, list):
+        for value in node:
+            collect_security_names(value, names)
+    return names
+
+def _pointer_parts(ref):
+    # JSON pointer unescaping: "~1" -> "/", "~0" -> "~"
+    return [p.replace("~1", "/").replace("~0", "~") for p in ref[2:].split("/")]
+
+def _definition_ref(ref):
+    # "#/components/schemas/Org/properties/x" -> "#/components/schemas/Org"
+    # "#/definitions/Org/properties/x"        -> "#/definitions/Org" (Swagger 2)
+    raw = ref[2:].split("/")
+    depth = 3 if raw[0] == "components" else 2
+    if raw[0] == "paths" or len(raw) <= depth:
+        return ref
+    return "#/" + "/".join(raw[:depth])
+
+class RefResolver:
+    """
+    `$ref` closure for a single spec. Each referenced definition is scanned once
+    and its outgoing refs memoized, so pruning many operations from the same
+    spec stays linear in the spec size. Refs are followed wherever they appear,
+    including allOf/oneOf/anyOf branches; cycles are visited once. Security
+    schemes, which requirements name rather than $ref, count as referenced too.
+    """
+    def __init__(self, spec):
+        self.spec = spec
+        self._edges = {} # ref -> refs directly inside its target
+
+    def resolve(self, ref):
+        node = self.spec
+        for part in _pointer_parts(ref):
+            if isinstance(node, list) and part.isdigit() and int(part) < len(node):
+                node = node[int(part)]
+            elif isinstance(node, dict) and part in node:
+                node = node[part]
+            else:
+                return None
+        return node
+
+    def _refs_of(self, ref):
+        if ref not in self._edges:
+            target = self.resolve(ref)
+            self._edges[ref] = collect_refs(target) if target is not None else set()
+        return self._edges[ref]
+
+    def security_refs(self, node):
+        """
+        Refs to the security schemes node's requirements name, plus those of the
+        spec's top-level `security` (which applies to every operation).
+        """
+        if isinstance(self.spec.get("components"), dict):
+            container, schemes = "#/components/securitySchemes/", self.spec["components"].get("securitySchemes")
+        else:
+            container, schemes = "#/securityDefinitions/", self.spec.get("securityDefinitions") # Swagger 2
+        if not isinstance(schemes, dict):
+            return set()
+        names = collect_security_names(node, collect_security_names({"security": self.spec.get("security", [])}))
+        return {container + name.replace("~", "~0").replace("/", "~1") for name in names if name in schemes}
+
+    def closure(self, node):
+        """
+        Transitive set of local refs reachable from node, including the security
+        schemes it uses. Refs into the middle of a definition are widened to the
+        whole definition, since that is what gets kept.
+        """
+        seen = set()
+        pending = list(collect_refs(node) | self.security_refs(node))
+        while pending:
+            ref = _definition_ref(pending.pop())
+            if ref in seen:
+                continue
+            seen.add(ref)
+            pending.extend(self._refs_of(ref) - seen)
+        return seen
+
+    def reachable_definitions(self, node):
+        """
+        The spec's definition containers restricted to what node transitively
+        references, in spec order: {"components": {section: {name: ...}}} for
+        OpenAPI 3, or e.g. {"definitions": {name: ...}} for Swagger 2.
+        """
+        wanted = {tuple(_pointer_parts(ref)) for ref in self.closure(node)}
+
+        pruned = {}
+        # Walk in spec order so the output (and training targets) are deterministic
+        for container, entries in self.spec.items():
+            if not isinstance(entries, dict):
+                continue
+            if container == "components":
+                for section, defs in entries.items():
+                    if not isinstance(defs, dict):
+                        continue
+                    for name, definition in defs.items():
+                        if ("components", section, name) in wanted:
+                            pruned.setdefault("components", {}).setdefault(section, {})[name] = definition
+            elif container != "paths":
+                for name, definition in entries.items():
+                    if (container, name) in wanted:
+                        pruned.setdefault(container, {})[name] = definition
+        return pruned
+
+# --- Lexical operation scoring ---
+
+def iter_operations(spec):
+    for path, methods in spec.get("paths", {}).items():
+        if not isinstance(methods, dict):
+            continue
+        for method, op in methods.items():
+            if method in HTTP_METHODS and isinstance(op, dict):
+                yield path, method, op
+
+def _operation_text(path, method, op):
+    parts = [path, method, op.get("operationId", ""), op.get("summary", ""), op.get("description", "")]
+    parts.extend(op.get("tags", []))
+    for param in op.get("parameters", []):
+        if isinstance(param, dict):
+            parts.append(param.get("name", ""))
+    return " ".join(str(p) for p in parts)
+
+def score_operations(query, spec):
+    """
+    BM25 score of every operation in spec against query.
+    Returns: list of (score, path, method), in spec order.
+    """
+    ops = list(iter_operations(spec))
+    docs = [Counter(tokenize(_operation_text(p, m, op))) for p, m, op in ops]
+    if not docs:
+        return []
+    avg_len = sum(sum(d.values()) for d in docs) / len(docs) or 1.0
+    df = Counter(term for d in docs for term in d)
+
+    query_terms = set(tokenize(query))
+    scores = []
+    for (path, method, _), doc in zip(ops, docs):
+        doc_len = sum(doc.values())
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (len(docs) - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_len))
+        scores.append((score, path, method))
+    return scores
+
+def prune_schema(query, spec, top_k, keep=()):
+    """
+    Keeps the top_k operations most relevant to query (plus any (path, method)
+    in keep), and only the components they transitively reference.
+    Specs with no more than top_k operations are returned unchanged.
+    """
+    scores = score_operations(query, spec)
+    if len(scores) <= top_k:
+        return spec
+
+    # Stable sort: ties keep spec order, so output is deterministic
+    ranked = sorted(range(len(scores)), key=lambda i: -scores[i][0])
+    selected = {(scores[i][1], scores[i][2]) for i in ranked[:top_k]}
+    selected.update(keep)
+
+    paths = {}
+    for path, method, op in iter_operations(spec):
+        if (path, method) in selected:
+            if path not in paths:
+                # Path-level entries (shared parameters, servers, ...) stay with the path
+                paths[path] = {k: v for k, v in spec["paths"][path].items() if k not in HTTP_METHODS}
+            paths[path][method] = op
+    reachable = RefResolver(spec).reachable_definitions(paths)
+    pruned = {}
+    for key, value in spec.items():
+        if key == "paths":
+            pruned[key] = paths
+        elif key == "components" or (key in reachable and isinstance(value, dict)):
+            pruned[key] = reachable.get(key, {})
+        elif key in SWAGGER2_DEFINITION_CONTAINERS:
+            pruned[key] = {}
+        else:
+            pruned[key] = value
+    return pruned
@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Configuration
+SPEC_STORE_DIR = "../../data/spec_store"
+PARSED_CACHE_SIZE = 64 # Parsed specs kept in memory per process
+
+class SpecStore:
+    """
+    Content-addressed blob store for full schemas. Each spec is written once as
+    <root>/<hash[:2]>/<hash>.json, where hash is the sha256 of its json.dumps text,
+    and training rows reference it by hash instead of embedding a copy.
+    Reads are lazy and go through an LRU of parsed specs.
+    """
+    def __init__(self, root=SPEC_STORE_DIR, cache_size=PARSED_CACHE_SIZE):
+        self.root = root
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # hash -> parsed spec
+        self.lock = threading.Lock() # Guards cache; shared by concurrent distill_batch / _submit callers
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, spec_hash):
+        return os.path.join(self.root, spec_hash[:2], spec_hash + ".json")
+
+    def put(self, spec):
+        """Stores spec (if not already present). Returns: its hash."""
+        text = json.dumps(spec)
+        spec_hash = self.hash_text(text)
+        path = self._blob_path(spec_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write-then-rename so concurrent shards never see a partial blob
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+        return spec_hash
+
+    def get(self, spec_hash):
+        """Parsed spec for hash (raises FileNotFoundError if unknown)."""
+        with self.lock:
+            spec = self.cache.get(spec_hash)
+            if spec is not None:
+                self.cache.move_to_end(spec_hash)
+                return spec
+        # Parse outside the lock; two threads missing the same hash just both read it
+        with open(self._blob_path(spec_hash), 'r', encoding='utf-8') as f:
+            spec = json.load(f)
+        with self.lock:
+            self.cache[spec_hash] = spec
+            self.cache.move_to_end(spec_hash)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return spec
+
+def load_schema(row, store):
+    """
+    Full schema of a training/benchmark row: resolved through the store for
+    `schema_hash` rows, or parsed from older rows that embed `full_schema`.
+    """
+    spec_hash = row.get("schema_hash")
+    if isinstance(spec_hash, str) and spec_hash: # NaN when old and new rows are mixed in one frame
+        return store.get(spec_hash)
+    return json.loads(row["full_schema"])
@@ -0,0 +1,120 @@
+import json
+import hashlib
+from collections import OrderedDict
+
+# Token accounting shared by the MCP extractors, the Track 1 benchmark and the
+# AID efficiency benchmark. Counts come from the tokenizer of the model that
+# actually reads the text; the old word-count formula is only used when no
+# tokenizer can be loaded.
+
+TOKENIZER_ID = "Qwen/Qwen2.5-14B-Instruct"
+COUNT_BATCH_SIZE = 256     # Texts per fast-tokenizer call
+COUNT_CACHE_SIZE = 100000  # Counts kept per counter, keyed by content hash
+
+# Legacy estimate: 50 (base) + (word_count / 0.75) + (param_count * 40)
+HEURISTIC_BASE_COST = 50
+HEURISTIC_PER_PARAM_COST = 40
+HEURISTIC_WORD_DIVISOR = 0.75
+
+def heuristic_tokens(description, param_count):
+    """Word-count estimate of a tool schema (fallback only)."""
+    words = len((description or "").split())
+    return int(HEURISTIC_BASE_COST + words / HEURISTIC_WORD_DIVISOR + param_count * HEURISTIC_PER_PARAM_COST)
+
+def render_tool_schema(tool):
+    """The text a tool definition costs once it is loaded into a prompt."""
+    schema = {
+        "name": tool.get("unique_name", tool.get("name", "")),
+        "description": tool.get("description", ""),
+        "parameters": tool.get("parameters", {})
+    }
+    return json.dumps(schema, indent=2)
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_tokenizer(model_id=TOKENIZER_ID):
+    """The model's tokenizer, or None when transformers/the tokenizer is unavailable."""
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+    except Exception as e:
+        print(f"⚠️ Tokenizer {model_id} unavailable ({e}); falling back to word-count estimates.")
+        return None
+
+class TokenCounter:
+    """
+    Counts tokens with a real tokenizer. Uncached texts are tokenized together in
+    batches of COUNT_BATCH_SIZE (one call into the fast tokenizer each), and every
+    count is cached under the sha256 of its text, so catalogs full of repeated
+    tools and prompts cost one tokenization per distinct text.
+
+    With no tokenizer (tokenizer=False, or loading failed) counts are word-count
+    estimates and `exact` is False.
+    """
+    def __init__(self, tokenizer=None, model_id=TOKENIZER_ID, cache_size=COUNT_CACHE_SIZE):
+        if tokenizer is None:
+            tokenizer = load_tokenizer(model_id)
+        self.tokenizer = None if tokenizer is False else tokenizer
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # content hash -> token count
+
+    @property
+    def exact(self):
+        return self.tokenizer is not None
+
+    def count(self, text):
+        return self.count_many([text])[0]
+
+    def count_many(self, texts):
+        keys = [content_hash(t) for t in texts]
+        missing = OrderedDict() # key -> text, each distinct uncached text once
+        for key, text in zip(keys, texts):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+            else:
+                missing[key] = text
+
+        fresh = {}
+        pending = list(missing.items())
+        for start in range(0, len(pending), COUNT_BATCH_SIZE):
+            batch = pending[start:start + COUNT_BATCH_SIZE]
+            for (key, _), n in zip(batch, self._tokenize_counts([t for _, t in batch])):
+                fresh[key] = n
+                self._remember(key, n)
+        return [fresh[k] if k in fresh else self.cache[k] for k in keys]
+
+    def _tokenize_counts(self, texts):
+        if self.tokenizer is None:
+            return [int(len(t.split()) / HEURISTIC_WORD_DIVISOR) for t in texts]
+        ids = self.tokenizer(texts, add_special_tokens=False, return_attention_mask=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    def _remember(self, key, n):
+        self.cache[key] = n
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    # --- Budgets ---
+
+    def count_tools(self, tools):
+        """Per-tool schema tokens, in order."""
+        if self.tokenizer is None:
+            return [heuristic_tokens(t.get("description"), len(t.get("parameters") or {})) for t in tools]
+        return self.count_many([render_tool_schema(t) for t in tools])
+
+    def prompt_budget(self, messages, limit=None):
+        """
+        Tokens of a chat prompt as the model sees it (chat template applied,
+        generation prompt included), and what is left of limit.
+        """
+        if self.tokenizer is not None and getattr(self.tokenizer, "chat_template", None):
+            text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        else:
+            text = "\n".join(m["content"] for m in messages)
+        tokens = self.count(text)
+        return {
+            "tokens": tokens,
+            "limit": limit,
+            "remaining": None if limit is None else limit - tokens
+        }
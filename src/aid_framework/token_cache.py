@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from torch.utils.data import Dataset as TorchDataset
+
+# Pre-tokenized training data: built once, then memory-mapped by every run.
+#
+# <cache_dir>/input_ids.bin    uint32 token ids of all examples, back to back
+# <cache_dir>/offsets.npy      int64 [n + 1] start of each example in input_ids.bin
+# <cache_dir>/prompt_lens.npy  int32 [n] prompt tokens per example (masked out of the loss)
+# <cache_dir>/meta.json        what the cache was built from
+
+TOKEN_CACHE_DIR = "../../data/token_cache"
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of everything about the tokenizer that can change token ids."""
+    h = hashlib.sha256()
+    h.update(type(tokenizer).__name__.encode("utf-8"))
+    h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    h.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+def cache_key(tokenizer, source_path, **params):
+    """
+    Directory name of the cache for source_path tokenized with tokenizer.
+    params: anything else that changes the tokens (prompt template version,
+    pruning, max length, ...).
+    """
+    st = os.stat(source_path)
+    payload = {
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "source": [os.path.abspath(source_path), st.st_size, st.st_mtime_ns],
+        **params
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+class TokenCacheWriter:
+    """
+    Streams encoded examples into a new cache. Everything is written to a
+    temporary directory and renamed into place on close(), so an interrupted
+    build never leaves a half-written cache behind.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.tmp_dir = cache_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.ids_file = open(os.path.join(self.tmp_dir, "input_ids.bin"), "wb")
+        self.offsets = [0]
+        self.prompt_lens = []
+
+    def add(self, input_ids, prompt_len):
+        self.ids_file.write(np.asarray(input_ids, dtype=np.uint32).tobytes())
+        self.offsets.append(self.offsets[-1] + len(input_ids))
+        self.prompt_lens.append(prompt_len)
+
+    def close(self, meta):
+        self.ids_file.close()
+        np.save(os.path.join(self.tmp_dir, "offsets.npy"), np.asarray(self.offsets, dtype=np.int64))
+        np.save(os.path.join(self.tmp_dir, "prompt_lens.npy"), np.asarray(self.prompt_lens, dtype=np.int32))
+        with open(os.path.join(self.tmp_dir, "meta.json"), "w") as f:
+            json.dump({**meta, "examples": len(self.prompt_lens), "tokens": self.offsets[-1]}, f, indent=2)
+        os.replace(self.tmp_dir, self.cache_dir)
+
+class MemmapTokenDataset(TorchDataset):
+    """
+    Memory-mapped view of a token cache (optionally restricted to indices).
+    Items are causal-LM features ready for the collators in train.py.
+    """
+    def __init__(self, cache_dir, indices=None, _arrays=None):
+        if _arrays is None:
+            ids_path = os.path.join(cache_dir, "input_ids.bin")
+            ids = np.memmap(ids_path, dtype=np.uint32, mode="r") if os.path.getsize(ids_path) else np.zeros(0, dtype=np.uint32)
+            _arrays = (
+                ids,
+                np.load(os.path.join(cache_dir, "offsets.npy"), mmap_mode="r"),
+                np.load(os.path.join(cache_dir, "prompt_lens.npy"), mmap_mode="r")
+            )
+        self.cache_dir = cache_dir
+        self.ids, self.offsets, self.prompt_lens = _arrays
+        self.indices = np.arange(len(self.prompt_lens)) if indices is None else np.asarray(indices)
+
+    def subset(self, indices):
+        """View over some of this dataset's examples, sharing the same mappings."""
+        return MemmapTokenDataset(self.cache_dir, self.indices[np.asarray(indices, dtype=np.int64)], _arrays=(self.ids, self.offsets, self.prompt_lens))
+
+    @property
+    def lengths(self):
+        return (self.offsets[self.indices + 1] - self.offsets[self.indices]).tolist()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        j = self.indices[i]
+        input_ids = self.ids[self.offsets[j]:self.offsets[j + 1]].tolist()
+        prompt_len = int(self.prompt_lens[j])
+        return {
+            "input_ids": input_ids,
+            "attention_mask": [1] * len(input_ids),
+            "labels": [-100] * prompt_len + input_ids[prompt_len:]
+        }
@@ -1,4 +1,9 @@
 import os
+import json
+import bisect
+import argparse
+import importlib.util
+import numpy as np
 import pandas as pd
 import torch
 from datasets import Dataset
@@ -9,28 +14,176 @@ from transformers import (
     Trainer,
     DataCollatorForSeq2Seq
 )
+from transformers.trainer_pt_utils import LengthGroupedSampler
 from peft import LoraConfig, get_peft_model, TaskType
+from prompts import build_prompt, PROMPT_TEMPLATE_VERSION
+from schema_pruning import prune_schema, PRUNE_TOP_K, PRUNING_VERSION
+from spec_store import SpecStore, load_schema
+from token_cache import TOKEN_CACHE_DIR, cache_key, TokenCacheWriter, MemmapTokenDataset
 
 # Configuration
 TRAIN_FILE = "../../data/aid_training_data.jsonl"
 OUTPUT_DIR = "../../models/aid_distiller"
 MODEL_ID = "Qwen/Qwen2.5-14B-Instruct"
+MAX_SEQ_LEN = 2048      # Prompt + target; longer examples are dropped rather than truncated
+TRAIN_BATCH_SIZE = 4    # Per device; affordable now that batches are padded to their own longest example
+GRAD_ACCUM_STEPS = 1
+PACKED_BATCH_SIZE = 1   # Rows per device step when packing; each row already holds MAX_SEQ_LEN tokens
+TEST_FRACTION = 0.1
+SPLIT_SEED = 42         # Fixed so the train/test split is stable across runs sharing a token cache
+TOKENIZE_CHUNK_SIZE = 1000
+
+def build_prompts(examples, spec_store):
+    # Unified Prompt (schema first, query last; see prompts.py)
+    # Rows reference their spec by hash; older rows embed it as full_schema (both can mix in one chunk)
+    rows = [dict(zip(examples, values)) for values in zip(*examples.values())]
+    specs = [load_schema(row, spec_store) for row in rows]
+    if "path" in examples:
+        # Same lexical pre-pruning as inference, but the target operation always survives
+        specs = [prune_schema(q, spec, PRUNE_TOP_K, keep=[(p, m)])
+                 for q, spec, p, m in zip(examples["query"], specs, examples["path"], examples["method"])]
+    return [build_prompt(q, json.dumps(spec)) for q, spec in zip(examples["query"], specs)]
+
+def encode_examples(tokenizer, prompts, targets):
+    """
+    Causal-LM encoding: input_ids = prompt + target. The prompt tokens are later
+    masked out of the loss (-100) so only the distilled interface is learned.
+    No padding here; the collator pads each batch to its own longest example.
+    Returns: list of (input_ids, prompt_len)
+    """
+    prompt_ids = tokenizer(prompts)["input_ids"]
+    target_ids = tokenizer([t + tokenizer.eos_token for t in targets], add_special_tokens=False)["input_ids"]
+    return [(p + t, len(p)) for p, t in zip(prompt_ids, target_ids)]
+
+def build_token_cache(tokenizer, cache_dir):
+    """Tokenizes TRAIN_FILE once, streaming it in chunks, into a memory-mapped token cache."""
+    print(f"⏳ Tokenizing {TRAIN_FILE} into {cache_dir}...")
+    spec_store = SpecStore()
+    writer = TokenCacheWriter(cache_dir)
+    dropped = 0
+    for chunk in pd.read_json(TRAIN_FILE, lines=True, chunksize=TOKENIZE_CHUNK_SIZE):
+        examples = chunk.to_dict(orient="list")
+        for input_ids, prompt_len in encode_examples(tokenizer, build_prompts(examples, spec_store), examples["target_output"]):
+            if len(input_ids) > MAX_SEQ_LEN:
+                dropped += 1
+                continue
+            writer.add(input_ids, prompt_len)
+    writer.close({"train_file": TRAIN_FILE, "prompt_template_version": PROMPT_TEMPLATE_VERSION,
+                  "prune_top_k": PRUNE_TOP_K, "pruning_version": PRUNING_VERSION, "max_seq_len": MAX_SEQ_LEN, "dropped": dropped})
+    if dropped:
+        print(f"⚠️ Dropped {dropped} examples longer than {MAX_SEQ_LEN} tokens.")
+
+def load_token_datasets(tokenizer):
+    """Train/test views over the token cache for TRAIN_FILE, building it on first use."""
+    key = cache_key(tokenizer, TRAIN_FILE, prompt_template_version=PROMPT_TEMPLATE_VERSION,
+                    prune_top_k=PRUNE_TOP_K, pruning_version=PRUNING_VERSION, max_seq_len=MAX_SEQ_LEN)
+    cache_dir = os.path.join(TOKEN_CACHE_DIR, key)
+    if os.path.exists(cache_dir):
+        print(f"✅ Using token cache {cache_dir}")
+    else:
+        build_token_cache(tokenizer, cache_dir)
+
+    dataset = MemmapTokenDataset(cache_dir)
+    order = np.random.default_rng(SPLIT_SEED).permutation(len(dataset))
+    n_test = int(len(dataset) * TEST_FRACTION)
+    return {"train": dataset.subset(order[n_test:]), "test": dataset.subset(order[:n_test])}
+
+def pack_examples(dataset, seq_len):
+    """
+    Best-fit-decreasing packing of tokenized examples into rows of at most
+    seq_len tokens. position_ids restart at 0 for every example; flash-attention
+    treats each restart as a sequence boundary, so packed examples never attend
+    to each other. Prompt tokens are already -100, so no loss crosses a boundary.
+    Returns: (packed Dataset, packing efficiency = real tokens / row capacity)
+    """
+    lengths = dataset.lengths
+
+    bins = []
+    free = [] # Sorted (remaining capacity, bin index)
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        pos = bisect.bisect_left(free, (lengths[i], -1))
+        if pos < len(free):
+            remaining, b = free.pop(pos)
+        else:
+            remaining, b = seq_len, len(bins)
+            bins.append([])
+        bins[b].append(i)
+        bisect.insort(free, (remaining - lengths[i], b))
+
+    packed = {"input_ids": [], "labels": [], "position_ids": [], "length": []}
+    for members in bins:
+        row_ids, row_labels, row_pos = [], [], []
+        for i in members:
+            example = dataset[i]
+            row_ids.extend(example["input_ids"])
+            row_labels.extend(example["labels"])
+            row_pos.extend(range(lengths[i]))
+        packed["input_ids"].append(row_ids)
+        packed["labels"].append(row_labels)
+        packed["position_ids"].append(row_pos)
+        packed["length"].append(len(row_ids))
+
+    efficiency = sum(lengths) / max(1, len(bins) * seq_len)
+    return Dataset.from_dict(packed), efficiency
+
+class PackedCollator:
+    """
+    Stacks packed rows. The tail padding is its own segment (positions restart,
+    labels -100), and no attention_mask is sent so that flash-attention derives
+    the per-example boundaries from position_ids.
+    """
+    def __init__(self, pad_token_id):
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        width = max(len(f["input_ids"]) for f in features)
+        batch = {"input_ids": [], "labels": [], "position_ids": []}
+        for f in features:
+            pad = width - len(f["input_ids"])
+            batch["input_ids"].append(f["input_ids"] + [self.pad_token_id] * pad)
+            batch["labels"].append(f["labels"] + [-100] * pad)
+            batch["position_ids"].append(f["position_ids"] + list(range(pad)))
+        return {k: torch.tensor(v) for k, v in batch.items()}
+
+def length_grouping_args():
+    """TrainingArguments for length-grouped batches, on either side of the transformers 5 rename."""
+    if "train_sampling_strategy" in TrainingArguments.__dataclass_fields__:
+        return {"train_sampling_strategy": "group_by_length"}
+    return {"group_by_length": True}
+
+class LengthGroupedTrainer(Trainer):
+    """
+    Trainer whose length-grouped sampler takes the token cache's precomputed
+    lengths, instead of reading every example off the memmap to measure it.
+    """
+    def _get_train_sampler(self, *args, **kwargs):
+        dataset = args[0] if args else kwargs.get("train_dataset", self.train_dataset)
+        grouped = getattr(self.args, "train_sampling_strategy", None) == "group_by_length" or getattr(self.args, "group_by_length", False)
+        if not grouped or not isinstance(dataset, MemmapTokenDataset):
+            return super()._get_train_sampler(*args, **kwargs)
+        return LengthGroupedSampler(self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                                    dataset=dataset, lengths=dataset.lengths)
+
+def train(pack=False):
+    if pack and importlib.util.find_spec("flash_attn") is None:
+        # Other attention kernels ignore position_ids resets and would attend across examples
+        print("⚠️ Packing needs flash-attn for per-example attention; using dynamic padding instead.")
+        pack = False
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
 
-def train():
     print("⏳ Loading AID Dataset...")
-    df = pd.read_json(TRAIN_FILE, lines=True)
-    dataset = Dataset.from_pandas(df)
-    dataset = dataset.train_test_split(test_size=0.1)
+    tokenized_datasets = load_token_datasets(tokenizer)
     
     print("⏳ Loading Model...")
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID, trust_remote_code=True)
-    tokenizer.pad_token = tokenizer.eos_token
     
     model = AutoModelForCausalLM.from_pretrained(
         MODEL_ID,
         device_map="auto",
         torch_dtype=torch.float16,
-        trust_remote_code=True
+        trust_remote_code=True,
+        attn_implementation="flash_attention_2" if pack else None
     )
     
     peft_config = LoraConfig(
@@ -42,37 +195,37 @@ def train():
     )
     model = get_peft_model(model, peft_config)
     
-    def preprocess_function(examples):
-        # Unified Prompt
-        inputs = [f"Instruction: Distill this interface for query: \"{q}\"\nFull Schema: {s}\n\nDistilled Interface: " 
-                  for q, s in zip(examples["query"], examples["full_schema"])]
-        targets = [t + tokenizer.eos_token for t in examples["target_output"]]
-        
-        model_inputs = tokenizer(inputs, max_length=2048, truncation=True, padding="max_length")
-        labels = tokenizer(targets, max_length=2048, truncation=True, padding="max_length")
-        model_inputs["labels"] = labels["input_ids"]
-        return model_inputs
-
-    tokenized_datasets = dataset.map(preprocess_function, batched=True)
+    if pack:
+        for split in list(tokenized_datasets.keys()):
+            n_examples = len(tokenized_datasets[split])
+            tokenized_datasets[split], efficiency = pack_examples(tokenized_datasets[split], MAX_SEQ_LEN)
+            print(f"📦 Packed {n_examples} {split} examples into {len(tokenized_datasets[split])} rows "
+                  f"(packing efficiency {efficiency:.1%})")
+        data_collator = PackedCollator(tokenizer.pad_token_id)
+    else:
+        # Pads input_ids per batch and labels with -100, i.e. dynamic causal-LM padding
+        data_collator = DataCollatorForSeq2Seq(tokenizer, model=model, label_pad_token_id=-100, pad_to_multiple_of=8)
     
     training_args = TrainingArguments(
         output_dir=OUTPUT_DIR,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=4,
+        per_device_train_batch_size=PACKED_BATCH_SIZE if pack else TRAIN_BATCH_SIZE,
+        gradient_accumulation_steps=GRAD_ACCUM_STEPS,
         learning_rate=2e-4,
         num_train_epochs=1,
         fp16=True,
         save_steps=50,
         logging_steps=10,
-        report_to="none"
+        report_to="none",
+        # Similar lengths share a batch, so little padding is left
+        **({} if pack else length_grouping_args())
     )
     
-    trainer = Trainer(
+    trainer = LengthGroupedTrainer(
         model=model,
         args=training_args,
         train_dataset=tokenized_datasets["train"],
         eval_dataset=tokenized_datasets["test"],
-        data_collator=DataCollatorForSeq2Seq(tokenizer, model=model)
+        data_collator=data_collator
     )
     
     print("🚀 Starting AID Training...")
@@ -80,4 +233,7 @@ def train():
     model.save_pretrained(OUTPUT_DIR)
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="LoRA-train the AID distiller.")
+    parser.add_argument("--pack", action="store_true", help="Pack several examples into each MAX_SEQ_LEN row (needs flash-attn).")
+    args = parser.parse_args()
+    train(pack=args.pack)
@@ -2,17 +2,18 @@ import json
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from transformers import AutoTokenizer
 import sys
 sys.path.append("../aid_framework")
 from inference import InterfaceDistiller
+from spec_store import load_schema
+from token_accounting import TokenCounter
 
 # Configuration
 TEST_DATA = "../../data/aid_training_data.jsonl" # Use subset for test
 MODEL_ID = "Qwen/Qwen2.5-14B-Instruct"
 
-def count_tokens(tokenizer, text):
-    return len(tokenizer.encode(text))
+def count_tokens(counter, text):
+    return counter.count(text)
 
 def run_benchmark():
     print("🚀 Running Efficiency Benchmark...")
@@ -22,20 +23,20 @@ def run_benchmark():
     
     # Load Model
     distiller = InterfaceDistiller()
-    tokenizer = distiller.tokenizer
+    counter = TokenCounter(distiller.tokenizer)
     
     results = []
     
     for _, row in df.iterrows():
         query = row['query']
-        full_schema = json.loads(row['full_schema'])
+        full_schema = load_schema(row, distiller.spec_store)
         
         # 1. Distill
         mini_schema, _ = distiller.distill(query, full_schema)
         
         # 2. Measure
-        full_tokens = count_tokens(tokenizer, json.dumps(full_schema))
-        mini_tokens = count_tokens(tokenizer, json.dumps(mini_schema))
+        full_tokens = count_tokens(counter, json.dumps(full_schema))
+        mini_tokens = count_tokens(counter, json.dumps(mini_schema))
         
         reduction = (1 - (mini_tokens / full_tokens)) * 100
         
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import glob
+import argparse
+import pandas as pd
+sys.path.append("../aid_framework")
+from code_stubs import STUB_RENDERERS, mcp_server_stubs, openapi_stubs, identifier
+from token_accounting import TokenCounter
+
+# Tokens of tool definitions as JSON (what the prompts use today) vs. as typed
+# code stubs, per MCP server and per OpenAPI spec.
+
+MCP_DATASETS = [
+    "../../previous approach/track-1 data/mcp_dataset.json",
+    "../../previous approach/track-1 data/mcp_dataset_enhanced.json"
+]
+OPENAPI_DIR = "../../data/raw_specs"
+OUTPUT_CSV = "stub_token_report.csv"
+
+def iter_sources(mcp_paths, openapi_paths):
+    """Yields (kind, dataset, name, json forms, stub renderer)."""
+    for path in mcp_paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Skipping missing dataset {path}")
+            continue
+        with open(path) as f:
+            servers = json.load(f).get("servers", [])
+        for server in servers:
+            tools = server.get("tools", [])
+            if not tools:
+                continue
+            forms = {"json_indent": json.dumps(tools, indent=2), "json": json.dumps(tools)}
+            yield "mcp", os.path.basename(path), server.get("server_name", "unknown"), forms, lambda lang, s=server: mcp_server_stubs(s, lang)
+    for path in openapi_paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                spec = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {path}: {e}")
+            continue
+        if not spec.get("paths"):
+            continue
+        forms = {"json_indent": json.dumps(spec, indent=2), "json": json.dumps(spec)}
+        yield "openapi", os.path.basename(path), spec.get("info", {}).get("title", path), forms, lambda lang, s=spec: openapi_stubs(s, lang)
+
+def run_benchmark(mcp_paths, openapi_paths, out_dir=None, counter=None):
+    counter = counter or TokenCounter()
+    print(f"🚀 Counting schema tokens ({'tokenizer' if counter.exact else 'word-count estimate'})...")
+    rows = []
+    for kind, dataset, name, forms, render in iter_sources(mcp_paths, openapi_paths):
+        stubs = {lang: render(lang) for lang in STUB_RENDERERS}
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            for lang, text in stubs.items():
+                with open(os.path.join(out_dir, identifier(name) + STUB_RENDERERS[lang].extension), "w") as f:
+                    f.write(text + "\n")
+        texts = list(forms.values()) + list(stubs.values())
+        counts = dict(zip(list(forms) + [f"stub_{lang}" for lang in stubs], counter.count_many(texts)))
+        rows.append({"kind": kind, "dataset": dataset, "name": name, **counts})
+
+    df = pd.DataFrame(rows)
+    if df.empty:
+        print("❌ No tool definitions found.")
+        return df
+    for kind, group in df.groupby("kind"):
+        totals = group[["json_indent", "json", "stub_ts", "stub_py"]].sum()
+        print(f"\n=== {kind}: {len(group)} sources ===")
+        for col in ["json", "stub_ts", "stub_py"]:
+            print(f"   {col:12s} {totals[col]:>9,} tokens ({totals[col] / totals['json_indent']:.1%} of indented JSON)")
+        print(f"   {'json_indent':12s} {totals['json_indent']:>9,} tokens")
+    df.to_csv(OUTPUT_CSV, index=False)
+    print(f"\n📝 Saved results to {OUTPUT_CSV}")
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token counts of tool schemas as JSON vs. TypeScript/Python stubs.")
+    parser.add_argument("--mcp", nargs="*", default=MCP_DATASETS, help="mcp_dataset*.json files.")
+    parser.add_argument("--openapi", nargs="*", default=None, help=f"OpenAPI/Swagger JSON files (default: {OPENAPI_DIR}/*.json).")
+    parser.add_argument("--out", default=None, help="Also write the generated .d.ts/.pyi files here.")
+    args = parser.parse_args()
+    openapi = args.openapi if args.openapi is not None else sorted(glob.glob(os.path.join(OPENAPI_DIR, "*.json")))
+    run_benchmark(args.mcp, openapi, args.out)